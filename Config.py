@@ -10,13 +10,64 @@ class Config:
     BOT_TOKEN = os.getenv("BOT_TOKEN") or ""
 
     STORAGE_GROUP_ID = int(os.getenv("STORAGE_GROUP_ID", "0")) or None
+    # Comma-separated archive chats, forwards are sharded across them by user
+    STORAGE_GROUP_IDS = [
+        int(chat_id) for chat_id in os.getenv("STORAGE_GROUP_IDS", "").split(",") if chat_id.strip()
+    ] or ([STORAGE_GROUP_ID] if STORAGE_GROUP_ID else [])
+    # Sharding is only done by the anonbot pipeline, debounce and legacy archive to the first chat
+    ARCHIVE_CHAT_ID = STORAGE_GROUP_IDS[0] if STORAGE_GROUP_IDS else None
     OWNER_ID = int(os.getenv("OWNER_ID", "0")) or None
 
+    # Pipeline started by run.py: anonbot, debounce (main.py) or legacy (bot.py)
+    PIPELINE = os.getenv("PIPELINE", "anonbot")
+
     MAX_ALBUM_SIZE = 10
 
+    # Batching: debounce, window or media_group (see batching.py)
+    BATCHING_STRATEGY = os.getenv("BATCHING_STRATEGY", "media_group")
+
+    # Delivery: rebuild (new media from file_ids) or copy (server-side copies, keep captions;
+    # rebuilt again if a copy fails)
+    DELIVERY_MODE = os.getenv("DELIVERY_MODE", "rebuild")
+
+    # Pyrogram dispatcher workers (concurrent handler calls)
+    WORKERS = int(os.getenv("WORKERS", "0")) or min(32, (os.cpu_count() or 0) + 4)
+
+    # Worker processes for the pipeline, items are split between them by user_id (see workers.py)
+    WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+
+    # Event loop: asyncio or uvloop (pip install uvloop)
+    EVENT_LOOP = os.getenv("EVENT_LOOP", "asyncio")
+
+    # Refuse to start when TgCrypto is missing and pyrogram would use pure-Python AES
+    REQUIRE_TGCRYPTO = os.getenv("REQUIRE_TGCRYPTO", "").lower() in ("1", "true", "yes")
+
+    # Session storage: batched (in-memory peers, written in batches) or sqlite (pyrogram default)
+    SESSION_STORAGE = os.getenv("SESSION_STORAGE", "batched")
+    PEER_CACHE_SIZE = int(os.getenv("PEER_CACHE_SIZE", "50000"))
+    SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "5"))
+
+    # Per-item traces (set TRACE_SAMPLE_RATE=0 to disable), read with `python tracing.py`
+    TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+    # Shutdown: seconds to flush pending batches after SIGTERM (Heroku kills after 30)
+    DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20"))
+    PENDING_FILE = os.getenv("PENDING_FILE", "pending_batches.json")
+
     # Rate limits
     RATE_LIMIT_PER_CHAT = 1.0
     RATE_LIMIT_GLOBAL = 30
 
+    # Fair share of the global budget, "user_id:weight,..." (weight 1 by default)
+    USER_WEIGHTS = {
+        int(user_id): float(weight)
+        for user_id, weight in (
+            entry.split(":") for entry in os.getenv("USER_WEIGHTS", "").split(",") if entry.strip()
+        )
+    }
+    if OWNER_ID:
+        USER_WEIGHTS.setdefault(OWNER_ID, float(os.getenv("OWNER_WEIGHT", "4")))
+
     if not API_ID or not API_HASH or not BOT_TOKEN:
         raise ValueError("Missing required API credentials.")
@@ -1,4 +1,14 @@
-from pyrogram.types import InlineKeyboardButton
+class lazy:
+    """Class attribute built on first access, so importing Data does not load pyrogram"""
+
+    def __init__(self, build):
+        self.build = build
+
+    def __get__(self, obj, owner):
+        value = self.build()
+        setattr(owner, self.build.__name__, value)
+        return value
+
 
 class Data:
     # Start Message
@@ -18,11 +28,17 @@ A privacy-focused bot that removes metadata from your media files.
     """
     
     # Home Button
-    home_button = [[InlineKeyboardButton(text="🏠 Return Home 🏠", callback_data="home")]]
+    @lazy
+    def home_button():
+        from pyrogram.types import InlineKeyboardButton
+        return [[InlineKeyboardButton(text="🏠 Return Home 🏠", callback_data="home")]]
     
     # Rest Buttons
-    buttons = [
-        [InlineKeyboardButton("🎪 About The Bot 🎪", callback_data="about")],
-        [InlineKeyboardButton("♥ More Bots ♥", callback_data="more_bots")],
-        [InlineKeyboardButton("ℹ️ Help & Info ℹ️", callback_data="help_info")],
-    ]
+    @lazy
+    def buttons():
+        from pyrogram.types import InlineKeyboardButton
+        return [
+            [InlineKeyboardButton("🎪 About The Bot 🎪", callback_data="about")],
+            [InlineKeyboardButton("♥ More Bots ♥", callback_data="more_bots")],
+            [InlineKeyboardButton("ℹ️ Help & Info ℹ️", callback_data="help_info")],
+        ]
@@ -0,0 +1,71 @@
+import logging
+
+# ------------------ Album Planner ------------------
+#
+# Telegram only groups compatible media into one album: photos and videos can
+# be mixed, documents and audio each need an album of their own. An album
+# holds 2-10 items, a lone item has to go out as a normal message.
+
+MEDIA_KINDS = ("photo", "video", "document", "audio")
+
+ALBUM_GROUPS = {
+    "photo": "visual",
+    "video": "visual",
+    "document": "document",
+    "audio": "audio",
+}
+
+
+def media_kind(message):
+    """Return which of MEDIA_KINDS the message carries, or None"""
+    for kind in MEDIA_KINDS:
+        if getattr(message, kind, None):
+            return kind
+    return None
+
+
+def file_id_of(message):
+    return getattr(message, media_kind(message)).file_id
+
+
+def plan_albums(medias, max_size=10):
+    """Split a batch into the fewest albums Telegram accepts
+
+    Items are partitioned by album group, keeping their relative order, and
+    each partition is cut into ``ceil(n / max_size)`` albums of near-equal
+    size so no chunk is left with a single item. Partitions are returned in
+    order of their first item; unsupported media is skipped.
+    """
+    partitions = {}
+    for m in medias:
+        kind = media_kind(m)
+        if kind is None:
+            logging.warning(f"Skipping unsupported media in message {getattr(m, 'id', None)}")
+            continue
+        partitions.setdefault(ALBUM_GROUPS[kind], []).append(m)
+
+    albums = []
+    for items in partitions.values():
+        count = -(-len(items) // max_size)
+        size, extra = divmod(len(items), count)
+        start = 0
+        for i in range(count):
+            end = start + size + (1 if i < extra else 0)
+            albums.append(items[start:end])
+            start = end
+    return albums
+
+
+def is_whole_group(album, medias):
+    """True if ``album`` holds exactly the batch's items of one original album, in order
+
+    The batch may still hold only part of the album when batching split it;
+    check against the album on the server (``holds_group``) before copying it.
+    """
+    group = album[0].media_group_id
+    return bool(group) and album == [m for m in medias if m.media_group_id == group]
+
+
+def holds_group(album, group):
+    """True if ``album`` has every message of ``group``, the album as Telegram stores it"""
+    return sorted(m.id for m in album) == sorted(m.id for m in group)
@@ -1,16 +1,29 @@
 import asyncio
+import glob
 import time
 import logging
 from collections import defaultdict
-from pyrogram import Client, filters
+from contextlib import nullcontext
+from pyrogram import Client, filters, idle
 from pyrogram.errors import FloodWait, RPCError
 from pyrogram.types import (
     InputMediaPhoto,
     InputMediaVideo,
     InputMediaDocument,
+    InputMediaAudio,
 )
 
 from Config import Config
+from backends import check_crypto, install_event_loop
+from albums import file_id_of, holds_group, is_whole_group, media_kind, plan_albums
+from batching import get_strategy
+from fairqueue import FairLimiter
+from sessions import BatchedFileStorage
+from storage import StorageShards, is_shard_error
+from tasks import TaskScheduler
+from shutdown import (
+    ARCHIVED, DELETED, SENT, Progress, drain, load_pending, log_drain_metrics, persist_pending, worker_path
+)
 
 logging.getLogger("pyrogram").setLevel(logging.WARNING)
 logging.getLogger("pyrogram.client").setLevel(logging.WARNING)
@@ -24,49 +37,133 @@ logging.basicConfig(
 )
 
 # ------------------ Bot Init ------------------
+# Before the client and the limiter create their loop objects
+event_loop = install_event_loop(Config.EVENT_LOOP)
+crypto = check_crypto(Config.REQUIRE_TGCRYPTO)
+
 bot = Client(
     "AnonForwardBot",
     api_id=Config.API_ID,
     api_hash=Config.API_HASH,
-    bot_token=Config.BOT_TOKEN
+    bot_token=Config.BOT_TOKEN,
+    workers=Config.WORKERS
 )
 
+if Config.SESSION_STORAGE == "batched":
+    bot.storage = BatchedFileStorage(
+        bot.name, bot.workdir, Config.PEER_CACHE_SIZE, Config.SESSION_FLUSH_INTERVAL
+    )
+elif Config.SESSION_STORAGE != "sqlite":
+    raise ValueError(f"Unknown SESSION_STORAGE {Config.SESSION_STORAGE!r}, expected batched or sqlite")
+
+if Config.DELIVERY_MODE not in ("rebuild", "copy"):
+    raise ValueError(f"Unknown DELIVERY_MODE {Config.DELIVERY_MODE!r}, expected rebuild or copy")
+
+INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+# ------------------ Tracing ------------------
+class NullTracer:
+    """Stands in for tracing.Tracer when TRACE_SAMPLE_RATE is 0, without importing it"""
+
+    def __bool__(self):
+        return False
+
+    def start(self, key, **attributes):
+        return None
+
+    def get(self, key):
+        return None
+
+    def span(self, name, traces=None, **attributes):
+        return nullcontext()
+
+    def bind(self, traces):
+        return nullcontext()
+
+    def event(self, name, traces=None, **attributes):
+        pass
+
+    def finish(self, key, status="ok"):
+        pass
+
+    def expire(self, max_age):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+def make_tracer(path):
+    """Tracer writing to ``path``; tracing is only imported when items are sampled"""
+    if Config.TRACE_SAMPLE_RATE <= 0:
+        return NullTracer()
+    from tracing import Tracer
+    return Tracer(path, Config.TRACE_SAMPLE_RATE)
+
 # ------------------ State Storage ------------------
-media_groups = defaultdict(list)
-original_messages = defaultdict(list)
-user_locks = defaultdict(asyncio.Lock)
 last_send_time = defaultdict(float)
-global_timestamps = []
-processed_groups = set()  # NEW: Track processed media groups
+outbound = FairLimiter(Config.RATE_LIMIT_GLOBAL, Config.USER_WEIGHTS)  # global budget, shared fairly between users
 start_time = time.time()
+storage = StorageShards(Config.STORAGE_GROUP_IDS)
+scheduler = TaskScheduler("delivery")  # batching timers and deliveries, off the dispatcher workers
+# Deliveries are labelled with their batch: scheduler.labels maps task -> (user_id, chat_id, medias)
+draining = False
+progress = Progress()  # how far in-flight deliveries got, so a cut-off one saves only its tail
+late_messages = defaultdict(list)  # received after shutdown started
+tracer = make_tracer(Config.TRACE_FILE)
+front = None  # WorkerFront when items are handled by worker processes
 
 # ------------------ Rate Limiter ------------------
-async def rate_limit(chat_id):
-    global global_timestamps
-    now = time.time()
-    global_timestamps = [t for t in global_timestamps if now - t < 1]
-    if len(global_timestamps) >= Config.RATE_LIMIT_GLOBAL:
-        await asyncio.sleep(1)
-    delta = now - last_send_time[chat_id]
-    if delta < Config.RATE_LIMIT_PER_CHAT:
-        await asyncio.sleep(Config.RATE_LIMIT_PER_CHAT - delta)
-
-async def safe_send(func, chat_id, **kwargs):
+async def rate_limit(chat_id, user_id, cost=1):
+    with tracer.span("limiter_wait", chat_id=chat_id, cost=cost):
+        # Per-chat spacing first, so a global slot is not held while sleeping.
+        # The slot is reserved before sleeping: concurrent deliveries to one
+        # chat (a storage shard) queue up one RATE_LIMIT_PER_CHAT apart.
+        now = time.time()
+        slot = max(now, last_send_time[chat_id] + Config.RATE_LIMIT_PER_CHAT)
+        last_send_time[chat_id] = slot
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        await outbound.acquire(user_id, cost)
+
+async def safe_send(func, chat_id, flood_retry=True, user_id=None, cost=1, raise_errors=False, **kwargs):
+    """Rate-limited API call; ``user_id`` (default: the private chat) is charged ``cost`` messages
+
+    RPC errors are logged and give None, or are raised with ``raise_errors``.
+    """
     logging.debug(f"safe_send to {chat_id}: {func.__name__}")
+    if user_id is None:
+        user_id = chat_id
+    attempt = 0
     while True:
+        attempt += 1
         try:
-            await rate_limit(chat_id)
-            result = await func(chat_id=chat_id, **kwargs)
-            now = time.time()
-            last_send_time[chat_id] = now
-            global_timestamps.append(now)
+            await rate_limit(chat_id, user_id, cost)
+            with tracer.span(func.__name__, chat_id=chat_id, attempt=attempt):
+                result = await func(chat_id=chat_id, **kwargs)
+            # Spacing counts from the end of the call, never before a later reserved slot
+            last_send_time[chat_id] = max(last_send_time[chat_id], time.time())
             logging.debug(f"safe_send success: {func.__name__}")
             return result
         except FloodWait as e:
+            if not flood_retry:
+                tracer.event("flood_wait", chat_id=chat_id, seconds=e.value, retried=False)
+                raise
             logging.warning(f"FloodWait {e.value}s")
-            await asyncio.sleep(e.value)
+            with tracer.span("flood_wait", chat_id=chat_id, seconds=e.value, retried=True):
+                await asyncio.sleep(e.value)
         except RPCError as e:
             logging.error(f"RPCError in safe_send {func.__name__}: {e}")
+            tracer.event("rpc_error", chat_id=chat_id, error=str(e))
+            if raise_errors:
+                raise
             return None
 
 # ------------------ Memory Leak Prevention ------------------
@@ -76,27 +173,32 @@ async def cleanup_stale_sessions():
         await asyncio.sleep(600)  # 10 minutes
         now = time.time()
         
-        stale_users = []
-        for user_id, last_time in list(last_send_time.items()):
-            if now - last_time > 1800:  # 30 minutes idle
-                stale_users.append(user_id)
+        if storage:
+            logging.info(f"Storage shard status: {storage.status()}")
+        
+        tracer.expire(1800)
+        tracer.flush()
         
-        for user_id in stale_users:
-            if user_id in media_groups:
-                logging.info(f"Cleaning stale session for user {user_id}: {len(media_groups[user_id])} pending media")
-            media_groups.pop(user_id, None)
-            original_messages.pop(user_id, None)
-            last_send_time.pop(user_id, None)
-            # Clean up locks (they auto-recreate)
-            if user_id in user_locks:
-                del user_locks[user_id]
+        expire_stale_sessions(now)
+
+def expire_stale_sessions(now, max_idle=1800):
+    """Drop state of users idle for more than ``max_idle`` seconds (30 minutes)"""
+    stale_users = [user_id for user_id, last_time in last_send_time.items() if now - last_time > max_idle]
+    
+    for user_id in stale_users:
+        if user_id in batcher.media_groups:
+            logging.info(f"Cleaning stale session for user {user_id}: {len(batcher.media_groups[user_id])} pending media")
+        batcher.forget(user_id)
+        outbound.forget(user_id)
+        del last_send_time[user_id]
+    return len(stale_users)
 
 # ------------------ Core Handlers ------------------
 @bot.on_message(filters.private & filters.command("start"))
 async def start(client, message):
     logging.info(f"Start command from {message.from_user.id}")
     user_name = message.from_user.first_name
-    bot_name = (await client.get_me()).first_name
+    bot_name = client.me.first_name
     await message.reply_text(
         f"Hey {user_name}. \n\n"
         f"Welcome to {bot_name} \n\n"
@@ -104,88 +206,80 @@ async def start(client, message):
         "Send me media to get started."
     )
 
-@bot.on_message(filters.private & (filters.photo | filters.video | filters.document) & ~filters.me)
+@bot.on_message(filters.private & (filters.photo | filters.video | filters.document | filters.audio) & ~filters.me)
 async def handle_media(client, message):
-    group_id = message.media_group_id
+    # Only enqueue here: batching timers and deliveries run on the scheduler,
+    # so dispatcher workers are free for the next update right away
     user_id = message.from_user.id
     
-    logging.info(f"=== MEDIA HANDLER START: user={user_id}, media={message.media}, group_id={group_id} ===")
-    
     # Ignore bot's own messages
-    if message.from_user and message.from_user.is_bot and message.from_user.id == (await client.get_me()).id:
+    if message.from_user.is_bot and user_id == client.me.id:
         logging.info("Ignoring bot's own message")
         return
     
-    # Add media to user's queue (lock only for list manipulation)
-    async with user_locks[user_id]:
-        media_groups[user_id].append(message)
-        original_messages[user_id].append(message.id)
-        count = len(media_groups[user_id])
-        is_first = (count == 1)
-        logging.info(f"User {user_id}: Added media, total count={count}")
+    if draining:
+        logging.info(f"User {user_id}: shutting down, saving message {message.id} for the next start")
+        late_messages[(user_id, message.chat.id)].append(message)
+        return
     
-    # CASE 1: True album (has media_group_id)
-    if group_id:
-        group_key = f"{user_id}_{group_id}"
-        
-        # Check if already being processed
-        if group_key in processed_groups:
-            logging.info(f"User {user_id}: Album {group_id} already being processed, skipping")
-            return
-        
-        # Only first message of album processes it
-        if is_first:
-            processed_groups.add(group_key)
-            logging.info(f"User {user_id}: FIRST of TRUE ALBUM {group_id}, sleeping 1s to collect all items")
-            await asyncio.sleep(1.0)
-            
-            async with user_locks[user_id]:
-                final_count = len(media_groups[user_id])
-            
-            logging.info(f"User {user_id}: True album complete with {final_count} items, processing...")
-            await auto_send_album(user_id, message.chat.id)
-            processed_groups.discard(group_key)
-        
-        logging.info(f"=== MEDIA HANDLER END user={user_id} ===")
+    if front:
+        front.submit(message)
         return
     
-    # CASE 2: Individual files (no media_group_id) - use time-based batching
-    if is_first:
-        logging.info(f"User {user_id}: FIRST individual media, sleeping 2s to collect more")
-        await asyncio.sleep(2.0)
-        
-        async with user_locks[user_id]:
-            final_count = len(media_groups[user_id])
-        
-        logging.info(f"User {user_id}: After 2s wait, count={final_count}")
-        
-        # Check if max size reached
-        if final_count >= Config.MAX_ALBUM_SIZE:
-            logging.info(f"User {user_id}: MAX SIZE {Config.MAX_ALBUM_SIZE} hit, calling auto_send_album")
-            await auto_send_album(user_id, message.chat.id)
-            logging.info(f"=== MEDIA HANDLER END user={user_id} ===")
-            return
-        
-        # Single after wait
-        if final_count == 1:
-            logging.info(f"User {user_id}: SINGLE after wait, send_single_silent")
-            await send_single_silent(user_id, message.chat.id, media_groups[user_id][0])
-            await cleanup(user_id, message.chat.id)
-        else:
-            # Multiple individual files collected - send as album
-            logging.info(f"User {user_id}: MULTIPLE individual files ({final_count}), sleep 1s then auto_send_album")
-            await asyncio.sleep(1.0)
-            await auto_send_album(user_id, message.chat.id)
+    logging.info(f"User {user_id}: queued {message.media} (group_id={message.media_group_id})")
+    tracer.start(
+        (message.chat.id, message.id),
+        user_id=user_id,
+        message_id=message.id,
+        media=str(message.media),
+        media_group_id=message.media_group_id or "",
+    )
+    batcher.submit(user_id, message.chat.id, message)
+
+async def deliver_batch(user_id, chat_id, medias, archived=False):
+    """Deliver a batch closed by the batching strategy, True once the originals are cleaned up
+
+    ``archived`` batches were forwarded to storage before the last shutdown.
+    """
+    logging.info(f"User {user_id}: batch closed with {len(medias)} items")
+    if archived:
+        progress.mark(chat_id, medias, ARCHIVED)
     
-    logging.info(f"=== MEDIA HANDLER END user={user_id} ===")
+    traces = [t for t in (tracer.get((chat_id, m.id)) for m in medias) if t]
+    now = time.time_ns()
+    for trace in traces:
+        trace.add_span("batch_wait", trace.start_ns, now, batch_size=len(medias))
+    
+    status = "cancelled"
+    try:
+        with tracer.bind(traces):
+            ok = await auto_send_album(user_id, chat_id, medias, archived)
+        status = "ok" if ok else "failed"
+        return ok
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        for m in medias:
+            tracer.finish((chat_id, m.id), status)
+        # While draining, shutdown() reads it to save only what is left
+        if not draining:
+            progress.forget(chat_id, medias)
+
+def spawn_delivery(user_id, chat_id, medias, archived=False):
+    """Deliver a batch on the scheduler, listed in ``scheduler.labels`` until it is done"""
+    return scheduler.spawn(
+        deliver_batch(user_id, chat_id, medias, archived), label=(user_id, chat_id, medias)
+    )
+
+batcher = get_strategy(Config.BATCHING_STRATEGY, deliver_batch, Config.MAX_ALBUM_SIZE, scheduler)
 
 # ------------------ Auto Album System ------------------
-async def auto_send_album(user_id, chat_id):
+async def auto_send_album(user_id, chat_id, medias, archived=False):
     logging.info(f"=== AUTO_SEND_ALBUM: user={user_id}, chat={chat_id} ===")
-    medias = media_groups[user_id]
     if not medias:
         logging.warning(f"User {user_id}: No medias in auto_send_album")
-        return
+        return False
     
     count = len(medias)
     logging.info(f"auto_send_album: {count} medias")
@@ -193,134 +287,300 @@ async def auto_send_album(user_id, chat_id):
     # Single media edge case
     if count == 1:
         logging.info(f"auto_send_album: SINGLE, calling send_single_silent")
-        await send_single_silent(user_id, chat_id, medias[0])
-        await cleanup(user_id, chat_id)
-        return
+        if not await send_single_silent(user_id, chat_id, medias[0], archived):
+            return False
+        await cleanup(user_id, chat_id, medias)
+        return True
     
     # Forward entire album to storage as group
-    if Config.STORAGE_GROUP_ID:
+    if storage and not archived:
         logging.info(f"auto_send_album: Forwarding album of {count} to storage")
-        try:
-            message_ids = [m.id for m in medias]
-            await safe_send(
-                bot.forward_messages,
-                Config.STORAGE_GROUP_ID,
-                from_chat_id=chat_id,
-                message_ids=message_ids
-            )
-        except Exception as e:
-            logging.error(f"Storage album forward failed: {e}")
-    
-    # Build media list
-    all_media = []
-    for i, m in enumerate(medias):
-        logging.debug(f"Building media_list[{i}]: {m.media}")
-        if m.photo:
-            all_media.append(InputMediaPhoto(m.photo.file_id))
-        elif m.video:
-            all_media.append(InputMediaVideo(m.video.file_id))
-        elif m.document:
-            all_media.append(InputMediaDocument(m.document.file_id))
+        if await forward_to_storage(user_id, chat_id, [m.id for m in medias]):
+            progress.mark(chat_id, medias, ARCHIVED)
     
-    logging.info(f"media_list built: {len(all_media)} items")
-    
-    # Split into chunks of 10 (Telegram's limit)
-    CHUNK_SIZE = 10
-    total_chunks = (len(all_media) + CHUNK_SIZE - 1) // CHUNK_SIZE
+    # Plan albums by compatible kind (photo+video, documents, audio)
+    albums = plan_albums(medias, Config.MAX_ALBUM_SIZE)
+    total_chunks = len(albums)
     success_count = 0
+    logging.info(f"Album plan: {[len(album) for album in albums]}")
     
-    for i in range(0, len(all_media), CHUNK_SIZE):
-        chunk = all_media[i:i+CHUNK_SIZE]
-        chunk_num = (i // CHUNK_SIZE) + 1
-        
-        logging.info(f"Sending chunk {chunk_num}/{total_chunks} with {len(chunk)} items")
-        result = await safe_send(bot.send_media_group, chat_id, media=chunk)
+    for chunk_num, album in enumerate(albums, 1):
+        logging.info(f"Sending chunk {chunk_num}/{total_chunks} with {len(album)} items")
+        if len(album) == 1:
+            result = await send_single(chat_id, album[0])
+        else:
+            result = await send_album(chat_id, album, medias)
         
         if result:
             success_count += 1
+            progress.mark(chat_id, album, SENT)
             logging.info(f"Chunk {chunk_num}/{total_chunks} sent successfully")
         else:
             logging.error(f"Failed to send chunk {chunk_num}/{total_chunks}")
             await bot.send_message(chat_id, "⚠️ Some media failed to send. Please try again.")
             logging.info(f"=== AUTO_SEND_ALBUM END (FAILED) user={user_id} ===")
-            return  # Don't cleanup on failure
+            return False  # Don't cleanup on failure
         
-        # Small delay between chunks to avoid flood
-        if i + CHUNK_SIZE < len(all_media):
-            await asyncio.sleep(0.5)
+        # Small delay between chunks to avoid flood, skipped while draining
+        if chunk_num < total_chunks and not draining:
+            with tracer.span("chunk_pacing"):
+                await asyncio.sleep(0.5)
     
     # Only cleanup if all chunks sent successfully
     if success_count == total_chunks:
         logging.info(f"All {total_chunks} chunks sent successfully, cleaning up")
-        await cleanup(user_id, chat_id)
+        await cleanup(user_id, chat_id, medias)
     else:
         logging.warning(f"Only {success_count}/{total_chunks} chunks succeeded, skipping cleanup")
     
     logging.info(f"=== AUTO_SEND_ALBUM END user={user_id} ===")
+    return success_count == total_chunks
 
-async def send_single_silent(user_id, chat_id, media):
-    logging.info(f"=== SINGLE SEND: user={user_id}, media={media.media} ===")
-    
-    # Forward to storage first
-    if Config.STORAGE_GROUP_ID:
+def build_media_list(album):
+    return [INPUT_MEDIA[media_kind(m)](file_id_of(m)) for m in album]
+
+async def whole_group_on_server(album):
+    """True if the album holds every message of its original album as Telegram has it"""
+    try:
+        # Rate-limited and charged to the user like the copy itself
+        group = await safe_send(
+            bot.get_media_group, album[0].chat.id, raise_errors=True, message_id=album[0].id
+        )
+    except Exception as e:
+        logging.warning(f"Could not fetch album {album[0].media_group_id}: {e}")
+        return False
+    if holds_group(album, group):
+        return True
+    # copy_media_group would also copy the items batched separately
+    logging.info(f"Album {album[0].media_group_id} was split across batches, sending this part rebuilt")
+    return False
+
+async def send_album(chat_id, album, medias):
+    """Send an album of 2-10 items, copied server-side if it is one whole original album"""
+    if Config.DELIVERY_MODE == "copy" and is_whole_group(album, medias) and await whole_group_on_server(album):
         try:
-            await safe_send(
-                bot.forward_messages,
-                Config.STORAGE_GROUP_ID,
-                from_chat_id=chat_id,
-                message_ids=media.id
+            result = await safe_send(
+                bot.copy_media_group, chat_id, cost=len(album),
+                from_chat_id=album[0].chat.id, message_id=album[0].id
             )
         except Exception as e:
-            logging.error(f"Storage forward failed: {e}")
-    
-    # Send the media
-    result = None
+            logging.error(f"Error copying album: {e}")
+            result = None
+        if result:
+            return result
+        logging.warning(f"Copying album of {len(album)} failed, sending it rebuilt")
+        tracer.event("copy_fallback", items=len(album))
+    return await safe_send(bot.send_media_group, chat_id, cost=len(album), media=build_media_list(album))
+
+async def send_single(chat_id, media):
+    """Send one media item as a normal message, copied server-side in copy mode"""
+    kind = media_kind(media)
+    logging.info(f"Sending {kind}")
+    if Config.DELIVERY_MODE == "copy":
+        try:
+            result = await safe_send(bot.copy_message, chat_id, from_chat_id=media.chat.id, message_id=media.id)
+        except Exception as e:
+            logging.error(f"Error copying message {media.id}: {e}")
+            result = None
+        if result:
+            return result
+        logging.warning(f"Copying message {media.id} failed, sending it rebuilt")
+        tracer.event("copy_fallback", items=1)
     try:
-        if media.photo:
-            logging.info("Sending photo")
-            result = await safe_send(bot.send_photo, chat_id, photo=media.photo.file_id)
-        elif media.video:
-            logging.info("Sending video")
-            result = await safe_send(bot.send_video, chat_id, video=media.video.file_id)
-        elif media.document:
-            logging.info("Sending document")
-            result = await safe_send(bot.send_document, chat_id, document=media.document.file_id)
-        elif media.audio:
-            logging.info("Sending audio")
-            result = await safe_send(bot.send_audio, chat_id, audio=media.audio.file_id)
+        return await safe_send(getattr(bot, f"send_{kind}"), chat_id, **{kind: file_id_of(media)})
     except Exception as e:
         logging.error(f"Error sending single media: {e}")
+        return None
+
+async def send_single_silent(user_id, chat_id, media, archived=False):
+    logging.info(f"=== SINGLE SEND: user={user_id}, media={media.media} ===")
+    
+    # Forward to storage first
+    if storage and not archived:
+        if await forward_to_storage(user_id, chat_id, [media.id]):
+            progress.mark(chat_id, [media], ARCHIVED)
     
-    if not result:
+    # Send the media
+    result = await send_single(chat_id, media)
+    
+    if result:
+        progress.mark(chat_id, [media], SENT)
+    else:
         logging.error("Single send failed, skipping cleanup")
         await bot.send_message(chat_id, "⚠️ Failed to send media. Please try again.")
     
     logging.info(f"=== SINGLE SEND END ===")
+    return result
 
 # ------------------ Storage & Cleanup ------------------
-async def cleanup(user_id, chat_id):
-    logging.debug(f"cleanup user {user_id}: {len(original_messages[user_id])} msgs")
+async def forward_to_storage(user_id, chat_id, message_ids):
+    """Forward to the user's storage shard, failing over to the next one on chat-level errors
+
+    The archive copy is skipped, not waited for, when every shard is blocked.
+    """
+    for shard in storage.route(user_id):
+        try:
+            result = await safe_send(
+                bot.forward_messages,
+                shard,
+                flood_retry=False,
+                user_id=user_id,
+                cost=len(message_ids),
+                raise_errors=True,
+                from_chat_id=chat_id,
+                message_ids=message_ids
+            )
+        except FloodWait as e:
+            storage.mark_flood(shard, e.value)
+            continue
+        except RPCError as e:
+            if is_shard_error(e):
+                storage.mark_failed(shard)
+                continue
+            # About these messages, another shard would refuse them too
+            logging.error(f"Storage forward of {message_ids} for user {user_id} failed: {e}")
+            return False
+        except Exception as e:
+            logging.error(f"Storage forward to {shard} failed: {e}")
+            return False
+        
+        if result:
+            storage.mark_ok(shard, len(message_ids))
+            return True
+        return False
+    
+    logging.warning(f"All storage shards blocked, skipping the archive copy for user {user_id}")
+    return False
+
+async def cleanup(user_id, chat_id, medias):
+    logging.debug(f"cleanup user {user_id}: {len(medias)} msgs")
     try:
-        for msg_id in original_messages[user_id][:]:
+        for m in medias:
+            trace = tracer.get((chat_id, m.id))
             try:
-                await bot.delete_messages(chat_id, msg_id)
-                await asyncio.sleep(0.05)
+                with tracer.span("delete", traces=[trace] if trace else (), message_id=m.id):
+                    await bot.delete_messages(chat_id, m.id)
+                progress.mark(chat_id, [m], DELETED)
+                if not draining:
+                    await asyncio.sleep(0.05)
             except Exception as e:
-                logging.warning(f"Could not delete message {msg_id}: {e}")
+                logging.warning(f"Could not delete message {m.id}: {e}")
         
-        media_groups[user_id].clear()
-        original_messages[user_id].clear()
         logging.info(f"Cleaned up user {user_id}")
     except Exception as e:
         logging.error(f"Cleanup failed for {user_id}: {e}")
 
+# ------------------ Shutdown ------------------
+async def restore_pending():
+    """Re-queue batches left over by the previous shutdown, worker processes' included"""
+    paths = [Config.PENDING_FILE] + sorted(glob.glob(worker_path(Config.PENDING_FILE, "*")))
+    for entry in (entry for path in paths for entry in load_pending(path)):
+        user_id, chat_id = entry["user_id"], entry["chat_id"]
+        if entry.get("delete_ids"):
+            # Sent before the shutdown, only the originals were left
+            logging.info(f"User {user_id}: deleting {len(entry['delete_ids'])} originals from last shutdown")
+            try:
+                await bot.delete_messages(chat_id, entry["delete_ids"])
+            except RPCError as e:
+                logging.warning(f"Could not delete originals {entry['delete_ids']} of user {user_id}: {e}")
+        if not entry["message_ids"]:
+            continue
+        try:
+            messages = await bot.get_messages(chat_id, entry["message_ids"])
+        except RPCError as e:
+            logging.error(f"Could not restore batch for user {user_id}: {e}")
+            continue
+        messages = [m for m in messages if m and not m.empty]
+        if messages:
+            logging.info(f"User {user_id}: restoring {len(messages)} items from last shutdown")
+            archived = entry.get("archived", False)
+            if front:
+                front.submit_batch(user_id, chat_id, messages, archived)
+            else:
+                spawn_delivery(user_id, chat_id, messages, archived)
+
+async def shutdown():
+    """Stop ingest, flush every pending batch within DRAIN_TIMEOUT and save the rest"""
+    global draining
+    draining = True
+    started = time.monotonic()
+    
+    if front:
+        # Workers drain and save their own batches
+        await front.stop(Config.DRAIN_TIMEOUT + 5)
+    
+    batches = batcher.collapse()
+    logging.info(
+        f"Draining {len(batches)} pending batches and {len(scheduler.labels)} in-flight deliveries "
+        f"(deadline {Config.DRAIN_TIMEOUT}s)"
+    )
+    delivered, lost = await drain(batches, deliver_batch, scheduler.labels, Config.DRAIN_TIMEOUT)
+    lost += [(user_id, chat_id, medias) for (user_id, chat_id), medias in late_messages.items()]
+    # Albums of a cut-off delivery that already reached the user are not sent again
+    lost = [r for r in (progress.remainder(*batch) for batch in lost) if r.medias or r.deletes]
+    
+    if lost:
+        try:
+            persist_pending(Config.PENDING_FILE, lost)
+        except OSError as e:
+            logging.error(f"Could not save undelivered batches: {e}")
+    log_drain_metrics(started, delivered, lost, Config.PENDING_FILE if lost else None)
+    tracer.close()
+
+async def main():
+    global front
+    await bot.start()
+    
+    if Config.WORKER_PROCESSES > 1:
+        from workers import WorkerFront  # only a sharded bot needs it
+        front = WorkerFront(bot, Config.WORKER_PROCESSES, Config.STORAGE_GROUP_IDS, Config.RATE_LIMIT_PER_CHAT)
+        front.start()
+    else:
+        # Start background cleanup task
+        scheduler.spawn(cleanup_stale_sessions())
+        logging.info("Background cleanup task started (runs every 10 minutes)")
+    
+    await restore_pending()
+    
+    # Returns on SIGINT/SIGTERM
+    await idle()
+    
+    logging.info("Shutdown signal received")
+    await shutdown()
+    await bot.stop()
+
+async def run_worker(index, count, link):
+    """Run the pipeline in worker process ``index`` of ``count``, API calls go through the front"""
+    global bot, outbound, tracer
+    bot = link.client
+    # An equal share of the global budget: users are spread evenly by user_id
+    outbound = FairLimiter(Config.RATE_LIMIT_GLOBAL / count, Config.USER_WEIGHTS)
+    tracer = make_tracer(worker_path(Config.TRACE_FILE, index))
+    Config.PENDING_FILE = worker_path(Config.PENDING_FILE, index)
+    
+    scheduler.spawn(cleanup_stale_sessions())
+    logging.info(f"Worker {index + 1}/{count} started")
+    
+    async for item in link.items():
+        if item[0] == "media":
+            await handle_media(bot, item[1])
+        elif item[0] == "batch":
+            spawn_delivery(*item[1:])
+    
+    await shutdown()
+
 # ------------------ Bot Start ------------------
-if __name__ == "__main__":
+def run():
     logging.info("Starting Anonymous Forward Bot...")
     logging.info(f"Max album size: {Config.MAX_ALBUM_SIZE}")
+    logging.info(f"Batching strategy: {Config.BATCHING_STRATEGY}")
+    logging.info(f"Dispatcher workers: {Config.WORKERS}")
+    logging.info(f"Worker processes: {Config.WORKER_PROCESSES}")
+    logging.info(f"Session storage: {Config.SESSION_STORAGE}")
+    logging.info(f"Delivery mode: {Config.DELIVERY_MODE}")
+    logging.info(f"Storage shards: {Config.STORAGE_GROUP_IDS or 'Not configured'}")
     
-    # Start background cleanup task
-    bot.loop.create_task(cleanup_stale_sessions())
-    logging.info("Background cleanup task started (runs every 10 minutes)")
-    
-    bot.run()
+    bot.run(main())
+
+if __name__ == "__main__":
+    run()
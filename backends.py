@@ -0,0 +1,58 @@
+import asyncio
+import functools
+import logging
+
+# ------------------ Crypto & Event Loop Backends ------------------
+#
+# pyrogram encrypts every MTProto packet with AES-256-IGE. With TgCrypto this
+# is done in C; if TgCrypto is missing (it fails to build on slim images
+# without a compiler) pyrogram quietly falls back to pure-Python AES and
+# throughput collapses. The event loop can be swapped for uvloop; it has to
+# be installed before the client and the limiter create their loop objects.
+# run.py does both before loading the pipeline; the calls are cached, so a
+# pipeline repeating them (anonbot does, for its worker processes) is a no-op.
+
+EVENT_LOOPS = ("asyncio", "uvloop")
+
+
+def crypto_backend():
+    """Return the AES implementation pyrogram loaded: tgcrypto or pyaes"""
+    from pyrogram.crypto import aes
+    return "tgcrypto" if getattr(aes, "tgcrypto", None) else "pyaes"
+
+
+@functools.cache
+def check_crypto(require=False):
+    """Report the crypto backend, raise RuntimeError without TgCrypto if ``require``"""
+    backend = crypto_backend()
+    if backend == "tgcrypto":
+        logging.info("Crypto backend: tgcrypto")
+    elif require:
+        raise RuntimeError(
+            "TgCrypto is not installed or failed to load and REQUIRE_TGCRYPTO is set, "
+            "refusing to start with pure-Python AES"
+        )
+    else:
+        logging.warning(
+            "Crypto backend: pure-Python AES, TgCrypto is missing. "
+            "Everything works but much slower, install it with `pip install tgcrypto`"
+        )
+    return backend
+
+
+@functools.cache
+def install_event_loop(name):
+    """Use the ``name`` event loop for loops created from now on, return the one in use"""
+    if name not in EVENT_LOOPS:
+        raise ValueError(f"Unknown EVENT_LOOP {name!r}, expected one of {', '.join(EVENT_LOOPS)}")
+    if name == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            logging.warning("EVENT_LOOP=uvloop but uvloop is not installed (pip install uvloop), using asyncio")
+            return "asyncio"
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        # pyrogram takes the loop from get_event_loop(), which uvloop does not create on demand
+        asyncio.set_event_loop(asyncio.new_event_loop())
+    logging.info(f"Event loop: {name}")
+    return name
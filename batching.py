@@ -0,0 +1,226 @@
+import asyncio
+import logging
+from collections import defaultdict, deque
+
+from tasks import TaskScheduler
+
+# ------------------ Batching Strategies ------------------
+#
+# A strategy collects incoming media per user and decides when a batch is
+# closed. Closed batches are handed to ``on_flush(user_id, chat_id, medias)``.
+# The three built-ins reproduce the algorithms of the original entry points:
+#
+#   debounce     main.py    - cancellable timer, restarted on every item
+#   window       bot.py     - one item at a time per user, as with the lock held across the sleep
+#   media_group  anonbot.py - media_group_id albums plus fixed sleeps
+
+
+class BatchingStrategy:
+    """Base class for batching strategies
+
+    ``submit`` never blocks: it queues the message and leaves timers and
+    deliveries to tasks on the strategy's scheduler.
+    """
+
+    name = None
+    DELAYS = {}
+
+    def __init__(self, on_flush, max_size=10, scheduler=None, **delays):
+        unknown = set(delays) - set(self.DELAYS)
+        if unknown:
+            raise ValueError(f"Unknown delays for {self.name}: {', '.join(sorted(unknown))}")
+        self.on_flush = on_flush
+        self.max_size = max_size
+        self.scheduler = scheduler if scheduler is not None else TaskScheduler("batching")
+        self.delays = {**self.DELAYS, **delays}
+        self.media_groups = defaultdict(list)
+        self.chats = {}
+
+    def queue(self, user_id, chat_id, message):
+        """Append a message to the user's pending batch and return its size"""
+        self.chats[user_id] = chat_id
+        self.media_groups[user_id].append(message)
+        return len(self.media_groups[user_id])
+
+    def submit(self, user_id, chat_id, message):
+        """Queue a message for the user and return at once"""
+        count = self.queue(user_id, chat_id, message)
+        self.schedule(user_id, chat_id, message, count)
+
+    def schedule(self, user_id, chat_id, message, count):
+        """Arrange for the batch to be closed when due"""
+        raise NotImplementedError
+
+    def flush(self, user_id, chat_id):
+        """Close the user's batch and return the task delivering it through ``on_flush``
+
+        The task is labelled with its batch, so ``scheduler.labels`` lists every
+        delivery from the moment it is created, not only once it runs.
+        """
+        medias = self.media_groups.pop(user_id, None)
+        if medias:
+            return self.scheduler.spawn(
+                self.on_flush(user_id, chat_id, medias), label=(user_id, chat_id, medias)
+            )
+        return None
+
+    def collapse(self):
+        """Close every pending batch at once and return them for delivery
+
+        Timers that are still running find their batch gone and do nothing
+        when they expire.
+        """
+        batches = [
+            (user_id, self.chats[user_id], medias)
+            for user_id, medias in self.media_groups.items()
+            if medias
+        ]
+        self.media_groups.clear()
+        return batches
+
+    def forget(self, user_id):
+        """Drop all state kept for an idle user"""
+        self.media_groups.pop(user_id, None)
+        self.chats.pop(user_id, None)
+
+    def pending(self):
+        return sum(len(medias) for medias in self.media_groups.values())
+
+
+class DebounceStrategy(BatchingStrategy):
+    """Restart a timer on every item, flush when it expires or the album is full"""
+
+    name = "debounce"
+    DELAYS = {"delay": 3.0}
+
+    def __init__(self, on_flush, max_size=10, scheduler=None, **delays):
+        super().__init__(on_flush, max_size, scheduler, **delays)
+        self.timers = {}
+
+    def schedule(self, user_id, chat_id, message, count):
+        timer = self.timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+
+        if count >= self.max_size:
+            self.flush(user_id, chat_id)
+        else:
+            self.timers[user_id] = self.scheduler.call_later(
+                self.delays["delay"], self._expire, user_id, chat_id
+            )
+
+    async def _expire(self, user_id, chat_id):
+        self.timers.pop(user_id, None)
+        self.flush(user_id, chat_id)
+
+    def collapse(self):
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        return super().collapse()
+
+    def forget(self, user_id):
+        timer = self.timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+        super().forget(user_id)
+
+
+class WindowStrategy(BatchingStrategy):
+    """Handle a user's items one at a time, waiting for more after the first one
+
+    This keeps the behaviour of the per-user lock the original bot.py held
+    across the sleep: items behind the one being collected wait in a
+    backlog, so they are never merged into its batch.
+    """
+
+    name = "window"
+    DELAYS = {"window": 2.0, "settle": 1.0}
+
+    def __init__(self, on_flush, max_size=10, scheduler=None, **delays):
+        super().__init__(on_flush, max_size, scheduler, **delays)
+        self.backlog = defaultdict(deque)
+        self.runners = {}
+
+    def submit(self, user_id, chat_id, message):
+        self.chats[user_id] = chat_id
+        self.backlog[user_id].append(message)
+        if user_id not in self.runners:
+            self.runners[user_id] = self.scheduler.spawn(self._run(user_id, chat_id))
+
+    async def _run(self, user_id, chat_id):
+        try:
+            while self.backlog.get(user_id):
+                message = self.backlog[user_id].popleft()
+                if self.queue(user_id, chat_id, message) == 1:
+                    await asyncio.sleep(self.delays["window"])
+
+                count = len(self.media_groups.get(user_id, ()))
+                if 1 < count < self.max_size:
+                    await asyncio.sleep(self.delays["settle"])
+
+                delivery = self.flush(user_id, chat_id)
+                if delivery:
+                    # A failed delivery is logged by the scheduler and must
+                    # not stop the user's backlog, as with the lock
+                    await asyncio.wait([delivery])
+        finally:
+            self.runners.pop(user_id, None)
+
+    def collapse(self):
+        for user_id, messages in self.backlog.items():
+            self.media_groups[user_id].extend(messages)
+        self.backlog.clear()
+        return super().collapse()
+
+    def forget(self, user_id):
+        self.backlog.pop(user_id, None)
+        super().forget(user_id)
+
+    def pending(self):
+        return super().pending() + sum(len(messages) for messages in self.backlog.values())
+
+
+class MediaGroupStrategy(BatchingStrategy):
+    """Use media_group_id for real albums, fixed sleeps for individual files"""
+
+    name = "media_group"
+    DELAYS = {"album": 1.0, "window": 2.0, "settle": 1.0}
+
+    def schedule(self, user_id, chat_id, message, count):
+        # Only the first item of a batch starts collecting
+        if count == 1:
+            group_id = getattr(message, "media_group_id", None)
+            self.scheduler.spawn(self._collect(user_id, chat_id, group_id))
+
+    async def _collect(self, user_id, chat_id, group_id):
+        # True album: give the rest of the group time to arrive
+        if group_id:
+            await asyncio.sleep(self.delays["album"])
+            self.flush(user_id, chat_id)
+            return
+
+        # Individual files: time-based batching
+        await asyncio.sleep(self.delays["window"])
+        count = len(self.media_groups.get(user_id, ()))
+        if 1 < count < self.max_size:
+            await asyncio.sleep(self.delays["settle"])
+        self.flush(user_id, chat_id)
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (DebounceStrategy, WindowStrategy, MediaGroupStrategy)
+}
+
+
+def get_strategy(name, on_flush, max_size=10, scheduler=None, **delays):
+    """Build the batching strategy registered under ``name``"""
+    try:
+        strategy = STRATEGIES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown batching strategy {name!r}, expected one of: {', '.join(STRATEGIES)}"
+        ) from None
+    logging.debug(f"Using batching strategy {name}")
+    return strategy(on_flush, max_size, scheduler, **delays)
@@ -0,0 +1,89 @@
+"""Compare input-order chunking with the type-aware album planner
+
+    python -m benchmarks.albums [--batches 10000] [--seed 1]
+
+Counts send calls, albums Telegram would reject (incompatible kinds mixed or
+a single-item album) and items that were never sent, on random mixed batches.
+"""
+import argparse
+import random
+from types import SimpleNamespace
+
+from albums import ALBUM_GROUPS, MEDIA_KINDS, media_kind, plan_albums
+
+ALBUM_LIMIT = 10
+
+
+def make_item(kind):
+    item = SimpleNamespace(**{k: None for k in MEDIA_KINDS})
+    setattr(item, kind, SimpleNamespace(file_id=kind))
+    return item
+
+
+def chunk_in_order(medias):
+    """The previous auto_send_album behaviour: drop audio, cut every ten items"""
+    kept = [m for m in medias if media_kind(m) != "audio"]
+    return [kept[i:i + ALBUM_LIMIT] for i in range(0, len(kept), ALBUM_LIMIT)]
+
+
+def score(plans, medias_total):
+    calls = rejected = sent = 0
+    for albums in plans:
+        for album in albums:
+            calls += 1
+            sent += len(album)
+            groups = {ALBUM_GROUPS[media_kind(m)] for m in album}
+            if len(groups) > 1 or len(album) > ALBUM_LIMIT:
+                rejected += 1
+    return calls, rejected, medias_total - sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    batches = []
+    for _ in range(args.batches):
+        size = rng.randint(2, 30)
+        kinds = rng.choices(MEDIA_KINDS, [5, 3, 2, 1], k=size)
+        batches.append([make_item(kind) for kind in kinds])
+    total = sum(len(b) for b in batches)
+
+    old = [chunk_in_order(b) for b in batches]
+    old_calls, old_rejected, old_dropped = score(old, total)
+    old_rejected += sum(1 for albums in old for album in albums if len(album) == 1)
+
+    new = [plan_albums(b, ALBUM_LIMIT) for b in batches]
+    new_calls, new_rejected, new_dropped = score(new, total)
+
+    # Fewest calls that can deliver every item: one per ten items of each album group
+    minimum = 0
+    for b in batches:
+        counts = {}
+        for m in b:
+            group = ALBUM_GROUPS[media_kind(m)]
+            counts[group] = counts.get(group, 0) + 1
+        minimum += sum(-(-n // ALBUM_LIMIT) for n in counts.values())
+
+    print(f"{args.batches} mixed batches, {total} items")
+    old_delivered = total - old_dropped - sum(
+        len(album) for albums in old for album in albums
+        if len(album) == 1 or len({ALBUM_GROUPS[media_kind(m)] for m in album}) > 1
+    )
+    print(f"{'path':<10} {'calls':>8} {'rejected':>9} {'dropped':>8} {'delivered':>10} {'calls/delivered':>16}")
+    for name, calls, rejected, dropped, delivered in (
+        ("in-order", old_calls, old_rejected, old_dropped, old_delivered),
+        ("planner", new_calls, new_rejected, new_dropped, total - new_dropped),
+    ):
+        print(
+            f"{name:<10} {calls:>8} {rejected:>9} {dropped:>8} {delivered:>10} "
+            f"{calls / max(delivered, 1):>16.3f}"
+        )
+    print(f"Lowest possible number of calls to deliver every item: {minimum}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Encryption speed of each crypto backend and scheduling overhead of each event loop
+
+    python -m benchmarks.backends [--size 64] [--duration 1.0]
+
+Crypto: MB/s of pyrogram's AES-256-IGE (every MTProto packet) and
+AES-256-CTR (file transfers) on ``--size`` KB payloads, with TgCrypto and
+with the pure-Python fallback pyrogram uses when TgCrypto is missing.
+Loops: microseconds per callback scheduled with call_soon, per task created
+and awaited, and per hop of a message between two tasks through a queue,
+for asyncio and, if installed, uvloop. Backends that are not installed are
+reported as such.
+"""
+import argparse
+import asyncio
+import importlib.util
+import logging
+import os
+import sys
+import time
+
+
+def load_aes(pure_python):
+    """A fresh copy of pyrogram.crypto.aes, optionally with TgCrypto hidden"""
+    saved = sys.modules.get("tgcrypto")
+    if pure_python:
+        sys.modules["tgcrypto"] = None
+    try:
+        spec = importlib.util.find_spec("pyrogram.crypto.aes")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if saved is not None:
+            sys.modules["tgcrypto"] = saved
+        else:
+            sys.modules.pop("tgcrypto", None)
+    if not pure_python and not getattr(module, "tgcrypto", None):
+        return None
+    return module
+
+
+def throughput(fn, payload, duration):
+    done = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        done += len(payload)
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            return done / elapsed / 2**20
+
+
+def bench_crypto(args):
+    payload = os.urandom(args.size * 1024)
+    key, iv = os.urandom(32), os.urandom(32)
+    print(f"{'crypto':<10} {'IGE MB/s':>10} {'CTR MB/s':>10}")
+    for name, pure_python in (("tgcrypto", False), ("pyaes", True)):
+        aes = load_aes(pure_python)
+        if aes is None:
+            print(f"{name:<10} {'not installed':>21}")
+            continue
+        ige = throughput(lambda: aes.ige256_encrypt(payload, key, iv), payload, args.duration)
+        ctr = throughput(lambda: aes.ctr256_encrypt(payload, key, bytearray(iv[:16])), payload, args.duration)
+        print(f"{name:<10} {ige:>10.2f} {ctr:>10.2f}")
+
+
+async def per_callback(count):
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    remaining = [count]
+
+    def step():
+        remaining[0] -= 1
+        if remaining[0]:
+            loop.call_soon(step)
+        else:
+            done.set_result(None)
+
+    start = time.perf_counter()
+    loop.call_soon(step)
+    await done
+    return (time.perf_counter() - start) / count * 1e6
+
+
+async def per_task(count):
+    async def nothing():
+        pass
+
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    for _ in range(count):
+        await loop.create_task(nothing())
+    return (time.perf_counter() - start) / count * 1e6
+
+
+async def per_hop(count):
+    ping, pong = asyncio.Queue(), asyncio.Queue()
+
+    async def echo():
+        for _ in range(count):
+            pong.put_nowait(await ping.get())
+
+    task = asyncio.get_running_loop().create_task(echo())
+    start = time.perf_counter()
+    for i in range(count):
+        ping.put_nowait(i)
+        await pong.get()
+    await task
+    return (time.perf_counter() - start) / (2 * count) * 1e6
+
+
+def bench_loops(args):
+    loops = {"asyncio": asyncio.new_event_loop}
+    try:
+        import uvloop
+        loops["uvloop"] = uvloop.new_event_loop
+    except ImportError:
+        loops["uvloop"] = None
+
+    print(f"{'loop':<10} {'call_soon us':>13} {'task us':>9} {'queue hop us':>13}")
+    for name, new_loop in loops.items():
+        if new_loop is None:
+            print(f"{name:<10} {'not installed':>23}")
+            continue
+        loop = new_loop()
+        try:
+            results = [loop.run_until_complete(bench(args.count)) for bench in (per_callback, per_task, per_hop)]
+        finally:
+            loop.close()
+        print(f"{name:<10} {results[0]:>13.2f} {results[1]:>9.2f} {results[2]:>13.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=64, help="payload KB")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per crypto measurement")
+    parser.add_argument("--count", type=int, default=200000, help="operations per loop measurement")
+    args = parser.parse_args()
+
+    # pyrogram warns about the missing TgCrypto on every pure-Python load
+    logging.disable(logging.WARNING)
+    bench_crypto(args)
+    print()
+    bench_loops(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Compare the batching strategies on identical simulated traffic
+
+    python -m benchmarks.batching [--users 20] [--submissions 10] [--scale 0.02]
+
+All delays (strategy timers, traffic gaps, API latency) are multiplied by
+``--scale`` so a few minutes of traffic replays in seconds; reported times
+are converted back to real seconds.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+from batching import STRATEGIES, get_strategy
+
+ALBUM_LIMIT = 10
+API_LATENCY = 0.15  # seconds per simulated send call
+
+
+def build_traffic(users, submissions, seed):
+    """Return a list of (user_id, offset, item) sorted by offset"""
+    rng = random.Random(seed)
+    traffic = []
+    next_id = 1
+    for user_id in range(1, users + 1):
+        t = rng.uniform(0, 5)
+        for n in range(submissions):
+            submission = (user_id, n)
+            kind = rng.choices(["single", "album", "burst", "multi_album"], [4, 3, 2, 1])[0]
+            items = []
+            if kind == "single":
+                items.append((t, None))
+            elif kind == "album":
+                group = f"{user_id}-{n}"
+                for _ in range(rng.randint(2, ALBUM_LIMIT)):
+                    items.append((t + rng.uniform(0, 0.3), group))
+            elif kind == "multi_album":
+                # A selection of more than ten files arrives as several albums
+                total = rng.randint(ALBUM_LIMIT + 1, 3 * ALBUM_LIMIT)
+                for i in range(total):
+                    group = f"{user_id}-{n}-{i // ALBUM_LIMIT}"
+                    items.append((t + (i // ALBUM_LIMIT) * 0.4 + rng.uniform(0, 0.3), group))
+            else:
+                offset = t
+                for _ in range(rng.randint(2, 15)):
+                    items.append((offset, None))
+                    offset += rng.uniform(0.2, 1.5)
+
+            for offset, group in items:
+                item = SimpleNamespace(id=next_id, media_group_id=group, submission=submission)
+                next_id += 1
+                traffic.append((user_id, offset, item))
+
+            t = max(offset for offset, _ in items) + rng.choice([rng.uniform(1, 4), rng.uniform(5, 20)])
+    traffic.sort(key=lambda entry: entry[1])
+    return traffic
+
+
+async def run_strategy(name, traffic, scale):
+    received = {}
+    delivered = {}
+    batches = []
+
+    async def on_flush(user_id, chat_id, medias):
+        calls = (len(medias) + ALBUM_LIMIT - 1) // ALBUM_LIMIT
+        await asyncio.sleep(API_LATENCY * calls * scale)
+        now = time.monotonic()
+        for m in medias:
+            delivered[m.id] = now
+        batches.append((medias, calls))
+
+    delays = {key: value * scale for key, value in STRATEGIES[name].DELAYS.items()}
+    strategy = get_strategy(name, on_flush, ALBUM_LIMIT, **delays)
+
+    start = time.monotonic()
+    for user_id, offset, item in traffic:
+        wait = start + offset * scale - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        received[item.id] = time.monotonic()
+        strategy.submit(user_id, user_id, item)
+
+    while len(delivered) < len(traffic):
+        await asyncio.sleep(0.01)
+
+    latencies = sorted((delivered[i] - received[i]) / scale for i in received)
+    calls = sum(c for _, c in batches)
+
+    groups = {}
+    for index, (medias, _) in enumerate(batches):
+        for m in medias:
+            if m.media_group_id:
+                groups.setdefault(m.media_group_id, set()).add(index)
+    split = sum(1 for indexes in groups.values() if len(indexes) > 1)
+    merged = sum(1 for medias, _ in batches if len({m.submission for m in medias}) > 1)
+
+    return {
+        "strategy": name,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "max": latencies[-1],
+        "calls_per_item": calls / len(traffic),
+        "album_split": split / len(groups) if groups else 0.0,
+        "wrong_merge": merged / len(batches),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--submissions", type=int, default=10)
+    parser.add_argument("--scale", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), action="append")
+    args = parser.parse_args()
+
+    traffic = build_traffic(args.users, args.submissions, args.seed)
+    print(f"{len(traffic)} items from {args.users} users, time scale {args.scale}")
+    print(f"{'strategy':<12} {'p50 s':>7} {'p95 s':>7} {'max s':>7} {'calls/item':>10} {'split':>7} {'merge':>7}")
+    for name in args.strategy or STRATEGIES:
+        r = asyncio.run(run_strategy(name, traffic, args.scale))
+        print(
+            f"{r['strategy']:<12} {r['p50']:>7.2f} {r['p95']:>7.2f} {r['max']:>7.2f} "
+            f"{r['calls_per_item']:>10.3f} {r['album_split']:>7.1%} {r['wrong_merge']:>7.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
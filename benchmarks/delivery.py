@@ -0,0 +1,195 @@
+"""Rebuilt versus server-side copied delivery: API calls, latency, failures and captions
+
+    python -m benchmarks.delivery [--batches 2000] [--rtt 0.08] [--fail 0.02] [--copy-fail 0.05]
+
+Runs anonbot.auto_send_album over the same batches in both DELIVERY_MODEs
+against a simulated API. Every round trip takes ``--rtt`` seconds and fails
+with probability ``--fail``; copies are also refused with probability
+``--copy-fail`` (original gone, protected content). Copying an album costs
+three round trips: the bot fetches the album to check the batch holds all
+of it, then pyrogram fetches it again and sends the copy.
+
+Batches are whole albums of 2-10 items, albums split over two batches (as
+batching does when items arrive far apart), single items, or several sends
+merged into one batch; captions are set on some items. Rate limits and
+pacing sleeps are left out, they are the same for both modes per call.
+A batch fails when any of its albums could not be delivered; duplicates
+are items the user received more than once.
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import random
+import statistics
+import time
+
+from pyrogram.errors import RPCError
+
+from benchmarks.offline import StubClient, make_message  # sets up the environment, before anonbot
+import anonbot
+from fairqueue import FairLimiter
+
+KINDS = ("photo", "photo", "photo", "video", "video", "document", "audio")
+
+
+class SimulatedBot(StubClient):
+    """Telegram API with a fixed round trip time and random failures"""
+
+    def __init__(self, messages, args, seed):
+        self.messages = messages
+        self.groups = {}
+        for m in messages.values():
+            self.groups.setdefault(m.media_group_id, []).append(m)
+        self.rtt = args.rtt
+        self.fail = args.fail
+        self.copy_fail = args.copy_fail
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.captions_kept = 0
+        self.delivered = collections.Counter()
+
+    async def round_trip(self, refuse=0.0):
+        self.calls += 1
+        await asyncio.sleep(self.rtt)
+        if self.rng.random() < self.fail + refuse:
+            raise RPCError("simulated failure")
+
+    def deliver(self, messages):
+        for m in messages:
+            self.delivered[m.id] += 1
+            self.captions_kept += bool(m.caption)
+
+    def rebuilt(self, file_id):
+        # Rebuilt media has no caption
+        self.delivered[int(file_id.split("-")[1])] += 1
+
+    async def get_media_group(self, chat_id, message_id):
+        await self.round_trip()
+        return self.groups[self.messages[message_id].media_group_id]
+
+    async def send_media_group(self, chat_id, media):
+        await self.round_trip()
+        for m in media:
+            self.rebuilt(m.media)
+        return [True] * len(media)
+
+    async def copy_media_group(self, chat_id, from_chat_id, message_id):
+        # Telegram copies the whole album, whatever the batch held
+        album = self.groups[self.messages[message_id].media_group_id]
+        await self.round_trip(self.copy_fail)  # get_media_group
+        await self.round_trip()
+        self.deliver(album)
+        return [True] * len(album)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id):
+        await self.round_trip(self.copy_fail)
+        self.deliver([self.messages[message_id]])
+        return True
+
+    async def answer(self, name, *args, **kwargs):
+        # send_photo, send_video, ...; the failure notice and deletions always go through
+        if name in ("send_message", "delete_messages"):
+            self.calls += 1
+            await asyncio.sleep(self.rtt)
+        else:
+            await self.round_trip()
+            self.rebuilt(kwargs[name[len("send_"):]])
+        return True
+
+
+def make_batches(count, seed):
+    rng = random.Random(seed)
+    ids = iter(range(1, 10**9))
+    groups = iter(range(1, 10**9))
+
+    def send(user_id, group=None):
+        kind = rng.choice(KINDS[:5] if group else KINDS)
+        caption = "caption" if rng.random() < 0.3 else None
+        return make_message(next(ids), kind, user_id, group, caption)
+
+    def album(user_id):
+        group = f"group-{next(groups)}"
+        return [send(user_id, group) for _ in range(rng.randint(2, 10))]
+
+    batches = []
+    for user_id in range(1000, 1000 + count):
+        shape = rng.random()
+        if shape < 0.4:
+            medias = album(user_id)
+        elif shape < 0.5:
+            # The first part is closed before the rest of the album arrives
+            medias = album(user_id)
+            split = rng.randint(1, len(medias) - 1)
+            batches.append((user_id, user_id, medias[:split]))
+            medias = medias[split:]
+        elif shape < 0.8:
+            medias = [send(user_id)]
+        else:
+            medias = [send(user_id) for _ in range(rng.randint(2, 6))]
+            if rng.random() < 0.5:
+                medias += album(user_id)[:10 - len(medias)]
+        batches.append((user_id, user_id, medias))
+    return batches
+
+
+async def run(mode, batches, args):
+    anonbot.Config.DELIVERY_MODE = mode
+    anonbot.Config.RATE_LIMIT_PER_CHAT = 0.0
+    anonbot.outbound = FairLimiter(1e9)
+    anonbot.draining = True  # skip the pacing sleeps
+    messages = {m.id: m for _, _, medias in batches for m in medias}
+    bot = anonbot.bot = SimulatedBot(messages, args, args.seed)
+
+    async def deliver(user_id, chat_id, medias):
+        start = time.perf_counter()
+        ok = await anonbot.auto_send_album(user_id, chat_id, medias)
+        return ok, time.perf_counter() - start
+
+    cpu = time.process_time()
+    results = await asyncio.gather(*(deliver(*batch) for batch in batches))
+    cpu = time.process_time() - cpu
+
+    latencies = sorted(latency for _, latency in results)
+    items = sum(len(medias) for _, _, medias in batches)
+    captions = sum(1 for m in messages.values() if m.caption)
+    return {
+        "calls": bot.calls / items,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "failed": sum(1 for ok, _ in results if not ok) / len(results),
+        "captions": bot.captions_kept / captions if captions else 0.0,
+        "duplicates": sum(n - 1 for n in bot.delivered.values()) / items,
+        "cpu": cpu / items * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=2000)
+    parser.add_argument("--rtt", type=float, default=0.08, help="seconds per API round trip")
+    parser.add_argument("--fail", type=float, default=0.02, help="chance any round trip fails")
+    parser.add_argument("--copy-fail", type=float, default=0.05, help="extra chance a copy is refused")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    batches = make_batches(args.batches, args.seed)
+    items = sum(len(medias) for _, _, medias in batches)
+
+    print(f"{args.batches} batches, {items} items, rtt {args.rtt}s, fail {args.fail:.0%}, copy refused {args.copy_fail:.0%}")
+    print(
+        f"{'mode':<8} {'calls/item':>10} {'p50 s':>7} {'p95 s':>7} {'failed':>7} "
+        f"{'duplicates':>10} {'captions kept':>14} {'cpu us/item':>12}"
+    )
+    for mode in ("rebuild", "copy"):
+        r = asyncio.run(run(mode, batches, args))
+        print(
+            f"{mode:<8} {r['calls']:>10.2f} {r['p50']:>7.2f} {r['p95']:>7.2f} {r['failed']:>7.1%} "
+            f"{r['duplicates']:>10.1%} "
+            f"{r['captions']:>14.0%} {r['cpu']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Measure update-handling latency while users upload media
+
+    python -m benchmarks.dispatch [--workers 8] [--scale 0.02]
+
+Emulates pyrogram's dispatcher (a fixed pool of workers pulling updates off
+one queue) and times ``/start`` updates while 1..N users keep uploading
+files. The ``blocking`` handler sleeps and delivers inside the handler like
+anonbot.py used to; the ``enqueue`` handler only submits to the batching
+strategy. Times are scaled by ``--scale`` and reported in real seconds.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+from batching import STRATEGIES, get_strategy
+
+API_LATENCY = 0.15  # seconds per simulated send call
+DELETE_PACING = 0.05
+UPLOAD_INTERVAL = 0.5  # seconds between files of one uploader
+DURATION = 30.0
+
+
+async def deliver(medias, scale):
+    calls = (len(medias) + 9) // 10
+    await asyncio.sleep((API_LATENCY * calls + DELETE_PACING * len(medias)) * scale)
+
+
+def blocking_handler(scale):
+    """The previous handle_media: collection sleeps and delivery inside the handler"""
+    media_groups = defaultdict(list)
+    locks = defaultdict(asyncio.Lock)
+    delays = {key: value * scale for key, value in STRATEGIES["media_group"].DELAYS.items()}
+
+    async def handle(user_id, message):
+        async with locks[user_id]:
+            media_groups[user_id].append(message)
+            is_first = len(media_groups[user_id]) == 1
+        if not is_first:
+            return
+        await asyncio.sleep(delays["window"])
+        if 1 < len(media_groups[user_id]) < 10:
+            await asyncio.sleep(delays["settle"])
+        medias = media_groups.pop(user_id)
+        await deliver(medias, scale)
+
+    return handle
+
+
+def enqueue_handler(scale):
+    async def on_flush(user_id, chat_id, medias):
+        await deliver(medias, scale)
+
+    delays = {key: value * scale for key, value in STRATEGIES["media_group"].DELAYS.items()}
+    strategy = get_strategy("media_group", on_flush, 10, **delays)
+
+    async def handle(user_id, message):
+        strategy.submit(user_id, user_id, message)
+
+    return handle
+
+
+async def run(mode, uploaders, workers, scale):
+    handle_media = {"blocking": blocking_handler, "enqueue": enqueue_handler}[mode](scale)
+    updates = asyncio.Queue()
+    latencies = []
+
+    async def worker():
+        while True:
+            kind, user_id, enqueued = await updates.get()
+            if kind == "start":
+                latencies.append((time.monotonic() - enqueued) / scale)
+            else:
+                await handle_media(user_id, SimpleNamespace(media_group_id=None))
+
+    async def uploader(user_id):
+        while True:
+            updates.put_nowait(("media", user_id, time.monotonic()))
+            await asyncio.sleep(UPLOAD_INTERVAL * scale)
+
+    async def starter():
+        while True:
+            updates.put_nowait(("start", 0, time.monotonic()))
+            await asyncio.sleep(0.5 * scale)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    tasks += [asyncio.create_task(uploader(user_id)) for user_id in range(1, uploaders + 1)]
+    tasks.append(asyncio.create_task(starter()))
+    await asyncio.sleep(DURATION * scale)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies.sort()
+    if not latencies:
+        return float("inf"), float("inf"), 0
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1], len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--scale", type=float, default=0.02)
+    parser.add_argument("--uploaders", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    print(f"/start latency with {args.workers} dispatcher workers, time scale {args.scale}")
+    print(f"{'uploaders':>9} {'mode':<9} {'p50 s':>8} {'p99 s':>8} {'handled':>8}")
+    for uploaders in args.uploaders:
+        for mode in ("blocking", "enqueue"):
+            p50, p99, handled = asyncio.run(run(mode, uploaders, args.workers, args.scale))
+            print(f"{uploaders:>9} {mode:<9} {p50:>8.3f} {p99:>8.3f} {handled:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Single-file latency while a heavy uploader is active, FIFO versus fair queueing
+
+    python -m benchmarks.fairness [--heavy-files 200] [--light-users 50] [--scale 0.1]
+
+A heavy user dumps ``--heavy-files`` files (sent as albums of ten, all
+batches delivering at once) every ``--period`` seconds while light users
+send single files. Both runs use the same FairLimiter token bucket at the
+global rate; ``fifo`` charges every request to one queue so they are
+granted in arrival order, ``fair`` charges each user separately. Times are
+scaled by ``--scale`` and reported in real seconds.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from fairqueue import FairLimiter
+
+RATE = 30  # messages per second, Config.RATE_LIMIT_GLOBAL
+HEAVY_USER = 0
+
+
+async def run(mode, args):
+    limiter = FairLimiter(RATE / args.scale, burst=RATE)
+    rng = random.Random(args.seed)
+    light, heavy = [], []
+
+    async def send(user_id, cost, latencies):
+        start = time.monotonic()
+        key = None if mode == "fifo" else user_id
+        await limiter.acquire(key, cost)  # storage forward
+        await limiter.acquire(key, cost)  # delivery
+        latencies.append((time.monotonic() - start) / args.scale)
+
+    async def heavy_user():
+        while True:
+            albums = [asyncio.create_task(send(HEAVY_USER, 10, heavy)) for _ in range(args.heavy_files // 10)]
+            await asyncio.sleep(args.period * args.scale)
+            await asyncio.gather(*albums)
+
+    async def light_user(user_id):
+        while True:
+            await asyncio.sleep(rng.expovariate(1 / args.light_interval) * args.scale)
+            asyncio.create_task(send(user_id, 1, light))
+
+    tasks = [asyncio.create_task(heavy_user())]
+    tasks += [asyncio.create_task(light_user(u)) for u in range(1, args.light_users + 1)]
+    await asyncio.sleep(args.duration * args.scale)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    light.sort()
+    return {
+        "p50": statistics.median(light),
+        "p99": light[int(len(light) * 0.99) - 1],
+        "singles": len(light),
+        "heavy_p50": statistics.median(heavy) if heavy else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--heavy-files", type=int, default=200)
+    parser.add_argument("--period", type=float, default=20.0, help="seconds between heavy dumps")
+    parser.add_argument("--light-users", type=int, default=50)
+    parser.add_argument("--light-interval", type=float, default=20.0, help="mean seconds between singles per light user")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--scale", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(
+        f"{args.heavy_files} files every {args.period:.0f}s from one user, "
+        f"{args.light_users} single-file users, {RATE} msg/s budget"
+    )
+    print(f"{'mode':<6} {'single p50 s':>13} {'single p99 s':>13} {'singles':>8} {'heavy album p50 s':>18}")
+    for mode in ("fifo", "fair"):
+        r = asyncio.run(run(mode, args))
+        print(f"{mode:<6} {r['p50']:>13.2f} {r['p99']:>13.2f} {r['singles']:>8} {r['heavy_p50']:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Microbenchmarks for the pipeline's hot functions with regression thresholds
+
+    python -m benchmarks.micro                    # compare with the baseline
+    python -m benchmarks.micro --save-baseline    # record a new baseline
+
+Runs anonbot's hot functions against a stub client, offline: rate_limit,
+building the InputMedia list of an album, the ingest step of handle_media,
+cleanup, and the stale-session scan over 100k users. For each it records
+calls per second and the peak bytes allocated per call. The run fails
+(exit code 1) when a function is slower or allocates more than the
+baseline by more than ``--threshold``, or when there is no baseline to
+compare with. Logging is disabled, so only the functions are measured.
+
+Baselines depend on the machine: record one on the machine that runs the
+check. Needs the bot's requirements installed; no Telegram connection or
+credentials are used.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.offline import StubClient, make_message  # sets up the environment, before anonbot
+import anonbot
+from batching import get_strategy
+from fairqueue import FairLimiter
+
+BASELINE = os.path.join(os.path.dirname(__file__), "micro_baseline.json")
+DURATION = 1.0  # seconds of timed calls per benchmark
+ALLOC_CALLS = 200
+STALE_USERS = 100_000
+
+
+async def noop_flush(user_id, chat_id, medias):
+    pass
+
+
+# Each benchmark returns (setup, call): setup() runs untimed before every call
+
+def bench_rate_limit():
+    anonbot.Config.RATE_LIMIT_PER_CHAT = 0.0
+    anonbot.outbound = FairLimiter(1e12)
+    counter = iter(range(10**12))
+
+    async def call():
+        await anonbot.rate_limit(next(counter) % 1000, 1)
+    return None, call
+
+
+def bench_build_media_list():
+    kinds = ["photo", "video", "photo", "video", "photo", "video", "photo", "photo", "video", "photo"]
+    album = [make_message(i, kind) for i, kind in enumerate(kinds)]
+
+    async def call():
+        anonbot.build_media_list(album)
+    return None, call
+
+
+def bench_ingest():
+    # Long timers so batches stay queued; the state is reset untimed
+    anonbot.batcher = get_strategy("media_group", noop_flush, 10, album=3600, window=3600, settle=3600)
+    messages = [make_message(i, user_id=1000 + i % 50) for i in range(500)]
+    counter = iter(range(10**12))
+
+    def setup():
+        if len(anonbot.batcher.media_groups) and anonbot.batcher.pending() >= 5000:
+            for task in list(anonbot.batcher.scheduler.tasks):
+                task.cancel()
+            anonbot.batcher.collapse()
+
+    async def call():
+        await anonbot.handle_media(anonbot.bot, messages[next(counter) % len(messages)])
+    return setup, call
+
+
+def bench_cleanup():
+    medias = [make_message(i) for i in range(10)]
+    # Skip the pacing sleep between deletions, only the bookkeeping is timed
+    anonbot.draining = True
+
+    async def call():
+        await anonbot.cleanup(1000, 1000, medias)
+    return None, call
+
+
+def bench_stale_scan():
+    anonbot.batcher = get_strategy("media_group", noop_flush, 10)
+    now = time.time()
+
+    def setup():
+        anonbot.last_send_time.clear()
+        for user_id in range(STALE_USERS):
+            # One user in ten has been idle for more than 30 minutes
+            anonbot.last_send_time[user_id] = now - (3600 if user_id % 10 == 0 else 60)
+
+    async def call():
+        anonbot.expire_stale_sessions(now)
+    return setup, call
+
+
+BENCHMARKS = {
+    "rate_limit": bench_rate_limit,
+    "build_media_list": bench_build_media_list,
+    "handle_media_ingest": bench_ingest,
+    "cleanup": bench_cleanup,
+    "expire_stale_sessions_100k": bench_stale_scan,
+}
+
+
+async def measure(name):
+    setup, call = BENCHMARKS[name]()
+
+    # Warm up
+    for _ in range(3):
+        if setup:
+            setup()
+        await call()
+
+    calls = 0
+    timed = 0.0
+    deadline = time.perf_counter() + DURATION
+    while time.perf_counter() < deadline:
+        if setup:
+            setup()
+        start = time.perf_counter()
+        await call()
+        timed += time.perf_counter() - start
+        calls += 1
+
+    gc.collect()
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(ALLOC_CALLS, calls)):
+        if setup:
+            setup()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        await call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    anonbot.draining = False
+    return {"ops_per_sec": calls / timed, "peak_bytes_per_call": sorted(peaks)[len(peaks) // 2]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), action="append")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    anonbot.bot = StubClient()
+    results = {}
+    for name in args.only or BENCHMARKS:
+        results[name] = asyncio.run(measure(name))
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    failed = []
+    print(f"{'benchmark':<28} {'ops/sec':>12} {'baseline':>12} {'bytes/call':>11} {'baseline':>10}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        status = ""
+        if base and not args.save_baseline:
+            slower = r["ops_per_sec"] < base["ops_per_sec"] * (1 - args.threshold)
+            # Small absolute changes in tiny allocations are noise
+            bigger = r["peak_bytes_per_call"] > max(base["peak_bytes_per_call"] * (1 + args.threshold),
+                                                    base["peak_bytes_per_call"] + 256)
+            if slower or bigger:
+                failed.append(name)
+                status = "  REGRESSION" + (" speed" if slower else "") + (" memory" if bigger else "")
+        print(
+            f"{name:<28} {r['ops_per_sec']:>12,.0f} "
+            f"{base['ops_per_sec'] if base else float('nan'):>12,.0f} "
+            f"{r['peak_bytes_per_call']:>11,} "
+            f"{base['peak_bytes_per_call'] if base else '-':>10}{status}"
+        )
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+    elif not baseline:
+        # Nothing to check against is a failure, or the gate would never fail
+        print(f"No baseline at {args.baseline}, record one with --save-baseline")
+        sys.exit(1)
+    elif failed:
+        print(f"{len(failed)} benchmark(s) regressed by more than {args.threshold:.0%}: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
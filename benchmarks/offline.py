@@ -0,0 +1,48 @@
+"""Offline stand-ins shared by the benchmarks that load anonbot
+
+Import this module before anonbot: it sets the environment anonbot reads at
+import time. Nothing connects to Telegram, traces are off and no storage
+chat is configured.
+"""
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "benchmark")
+os.environ.setdefault("BOT_TOKEN", "1:benchmark")
+os.environ["TRACE_SAMPLE_RATE"] = "0"
+os.environ["STORAGE_GROUP_IDS"] = ""
+os.environ["STORAGE_GROUP_ID"] = "0"
+
+
+class StubClient:
+    """Stands in for the pyrogram client, every API call goes to ``answer``"""
+
+    me = SimpleNamespace(id=1, first_name="bench", is_bot=True)
+
+    async def answer(self, name, *args, **kwargs):
+        return True
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.answer(name, *args, **kwargs)
+        call.__name__ = name
+        return call
+
+
+def make_message(i, kind="photo", user_id=1000, group=None, caption=None):
+    """A private-chat media message from ``user_id`` with the fields the pipeline reads"""
+    message = SimpleNamespace(
+        id=i,
+        media=kind,
+        media_group_id=group,
+        caption=caption,
+        chat=SimpleNamespace(id=user_id),
+        from_user=SimpleNamespace(id=user_id, is_bot=False),
+        photo=None, video=None, document=None, audio=None,
+    )
+    setattr(message, kind, SimpleNamespace(file_id=f"file-{i}"))
+    return message
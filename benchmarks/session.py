@@ -0,0 +1,87 @@
+"""Cost per update of pyrogram's FileStorage versus sessions.BatchedFileStorage
+
+    python -m benchmarks.session [--updates 100000] [--users 20000]
+
+Replays a stream of updates against both session storages, each on a fresh
+session file in a temporary workdir. Every update upserts its sender with
+``update_peers`` and resolves one peer for the reply with
+``get_peer_by_id``, like pyrogram does on receive and send. The batched
+storage writes changed peers every ``--interval`` seconds of traffic at
+``--rate``; the benchmark calls its flush at that pace instead of waiting
+for the flush task. The final ``save`` and ``close`` count as one more
+update.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from pyrogram.storage import FileStorage
+
+from sessions import BatchedFileStorage
+
+
+def build_stream(updates, users, seed):
+    rng = random.Random(seed)
+    stream = []
+    for _ in range(updates):
+        # A few heavy users send most of the media
+        user_id = int(rng.paretovariate(1.2)) % users + 1
+        username = f"user{user_id}" if rng.random() > 0.01 else f"user{user_id}_{rng.randint(0, 9)}"
+        stream.append((user_id, user_id * 7919, "user", username, None))
+    return stream
+
+
+async def replay(storage, stream, flush_every=None):
+    await storage.open()
+    timings = []
+    for n, row in enumerate(stream, 1):
+        start = time.perf_counter()
+        await storage.update_peers([row])
+        await storage.get_peer_by_id(row[0])
+        if flush_every and n % flush_every == 0:
+            storage.flush()
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    await storage.save()
+    await storage.close()
+    timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=200, help="updates per second")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between batched flushes")
+    parser.add_argument("--cache-size", type=int, default=50000, help="peers kept in memory by the batched storage")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    stream = build_stream(args.updates, args.users, args.seed)
+    flush_every = max(1, int(args.rate * args.interval))
+
+    print(f"{args.updates} updates from up to {args.users} users, batched flush every {flush_every} updates")
+    print(f"{'storage':<8} {'us/update':>10} {'p99 us':>9} {'max ms':>8} {'total s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for name, storage, every in (
+            ("file", FileStorage("file", workdir), None),
+            # The flush task would not run during the replay, flushes are made by hand
+            ("batched", BatchedFileStorage("batched", workdir, args.cache_size, flush_interval=3600), flush_every),
+        ):
+            timings = asyncio.run(replay(storage, stream, every))
+            ordered = sorted(timings)
+            print(
+                f"{name:<8} {statistics.mean(timings) * 1e6:>10.2f} "
+                f"{ordered[int(len(ordered) * 0.99)] * 1e6:>9.2f} "
+                f"{ordered[-1] * 1e3:>8.2f} {sum(timings):>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
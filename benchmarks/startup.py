@@ -0,0 +1,58 @@
+"""Cold start time and memory of each pipeline, started through run.py
+
+    python -m benchmarks.startup [--runs 5]
+
+Starts ``python run.py --check`` in a fresh interpreter for every PIPELINE
+and reports the median wall time and peak RSS of the process, next to a
+bare interpreter and one that only imports pyrogram, which the pipelines
+cannot start without. Needs the bot's requirements installed; dummy
+credentials are used and nothing connects to Telegram.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from run import PIPELINES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(command, env, runs):
+    seconds, rss = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds.append(time.perf_counter() - start)
+        if status:
+            raise RuntimeError(f"{' '.join(command)} failed, run it by hand to see why")
+        rss.append(usage.ru_maxrss / 1024)
+    return statistics.median(seconds), statistics.median(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ, API_ID="1", API_HASH="benchmark", BOT_TOKEN="1:benchmark", TRACE_SAMPLE_RATE="0")
+    cases = [
+        ("python", [sys.executable, "-c", "pass"], env),
+        ("pyrogram", [sys.executable, "-c", "import pyrogram"], env),
+    ]
+    cases += [
+        (name, [sys.executable, "run.py", "--check"], dict(env, PIPELINE=name))
+        for name in PIPELINES
+    ]
+
+    print(f"{'start':<10} {'seconds':>8} {'RSS MB':>7}")
+    for name, command, case_env in cases:
+        seconds, rss = measure(command, case_env, args.runs)
+        print(f"{name:<10} {seconds:>8.3f} {rss:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
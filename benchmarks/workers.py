@@ -0,0 +1,136 @@
+"""Pipeline throughput in one process versus N sharded worker processes
+
+    python -m benchmarks.workers [--workers 1 2 4] [--items 20000] [--work-us 200]
+
+Pushes ``--items`` media (albums of ten from ``--users`` users) through the
+real pipeline against a stub API that answers at once after ``--api-ms``.
+``inline`` runs the pipeline in the front process as WORKER_PROCESSES=1
+does; the other rows hand items to that many worker processes through
+workers.WorkerFront. ``--work-us`` adds CPU time per item in the pipeline
+to stand in for heavier per-item processing. Rate limits are lifted, so
+the result is the CPU-bound throughput in items per second, counted from
+the first item handed in to the last original deleted. Speedup is limited
+by the cores available and by the front, which makes every API call.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from benchmarks.offline import StubClient, make_message  # sets up the environment, before anonbot
+from workers import WorkerFront, worker_process
+
+
+class StubBot(StubClient):
+    """Answers every API call after ``latency`` seconds and counts deletions"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.deleted = 0
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    async def answer(self, name, *args, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if name == "delete_messages":
+            self.deleted += 1
+            if self.deleted >= self.expected:
+                self.done.set()
+        return True
+
+
+def make_messages(items, users):
+    # Albums of ten, users take turns
+    return [
+        make_message(i, user_id=1000 + (i // 10) % users, group=f"album-{i // 10}")
+        for i in range(items)
+    ]
+
+
+def configure(anonbot):
+    """Lift the rate limits and add the synthetic per-item work"""
+    anonbot.Config.RATE_LIMIT_PER_CHAT = 0.0
+    anonbot.Config.RATE_LIMIT_GLOBAL = 1e9
+    work = float(os.environ.get("BENCH_WORK_US", "0")) / 1e6
+    if work:
+        handle_media = anonbot.handle_media
+
+        async def busy_handle_media(client, message):
+            deadline = time.perf_counter() + work
+            while time.perf_counter() < deadline:
+                pass
+            await handle_media(client, message)
+        anonbot.handle_media = busy_handle_media
+
+
+def bench_worker(index, count, inbox, calls, replies, me):
+    # Logging stays on as in production but is not printed
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 2)
+    import anonbot
+    configure(anonbot)
+    worker_process(index, count, inbox, calls, replies, me)
+
+
+async def run(workers, messages, args):
+    stub = StubBot(args.api_ms / 1000)
+    stub.expected = len(messages)
+    if workers:
+        front = WorkerFront(stub, workers, target=bench_worker)
+        front.start()
+        submit = front.submit
+        # Workers are ready once they have imported the pipeline
+        await asyncio.sleep(args.startup)
+    else:
+        import anonbot
+        configure(anonbot)
+        anonbot.bot = stub
+        anonbot.outbound = anonbot.FairLimiter(anonbot.Config.RATE_LIMIT_GLOBAL)
+
+        def submit(message):
+            anonbot.scheduler.spawn(anonbot.handle_media(stub, message))
+
+    start = time.perf_counter()
+    for n, message in enumerate(messages, 1):
+        submit(message)
+        if n % 100 == 0:
+            await asyncio.sleep(0)
+    await stub.done.wait()
+    elapsed = time.perf_counter() - start
+
+    if workers:
+        await front.stop(30)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--work-us", type=float, default=200, help="extra CPU microseconds per item")
+    parser.add_argument("--api-ms", type=float, default=0.0, help="stub API latency")
+    parser.add_argument("--startup", type=float, default=3.0, help="seconds to let worker processes start")
+    args = parser.parse_args()
+
+    os.environ["BENCH_WORK_US"] = str(args.work_us)
+    logging.disable(logging.CRITICAL)
+    messages = make_messages(args.items, args.users)
+
+    print(
+        f"{args.items} items from {args.users} users, {args.work_us:.0f}us extra work per item, "
+        f"{os.cpu_count()} CPUs"
+    )
+    print(f"{'mode':<10} {'seconds':>8} {'items/s':>9} {'speedup':>8}")
+    base = None
+    for workers in [0] + args.workers:
+        elapsed = asyncio.run(run(workers, messages, args))
+        rate = args.items / elapsed
+        base = base or rate
+        name = f"{workers} proc" if workers else "inline"
+        print(f"{name:<10} {elapsed:>8.2f} {rate:>9.0f} {rate / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,9 @@ from pyrogram.types import (
     InputMediaDocument,
 )
 
-from config import Config
+from Config import Config
+from batching import get_strategy
+from tasks import TaskScheduler
 
 # ------------------ Logging ------------------ #
 
@@ -25,14 +27,13 @@ bot = Client(
     "AnonForwardBot",
     api_id=Config.API_ID,
     api_hash=Config.API_HASH,
-    bot_token=Config.BOT_TOKEN
+    bot_token=Config.BOT_TOKEN,
+    workers=Config.WORKERS
 )
 
 # ------------------ State Storage ------------------ #
 
-media_groups = defaultdict(list)
-original_messages = defaultdict(list)
-user_locks = defaultdict(asyncio.Lock)
+scheduler = TaskScheduler("legacy")  # collection sleeps and deliveries, off the dispatcher workers
 
 last_send_time = defaultdict(float)
 global_timestamps = []
@@ -88,39 +89,16 @@ async def start(client, message):
 
 @bot.on_message(filters.private & (filters.photo | filters.video | filters.document))
 async def handle_media(client, message):
-    user_id = message.from_user.id
-
-    async with user_locks[user_id]:
-        media_groups[user_id].append(message)
-        original_messages[user_id].append(message.id)
-        
-        count = len(media_groups[user_id])
-
-        # Wait for more media on first item
-        if count == 1:
-            await asyncio.sleep(2.0)  # Wait 2 seconds for more media
-            count = len(media_groups[user_id])
-        
-        # Auto-send if max reached
-        if count >= Config.MAX_ALBUM_SIZE:
-            await auto_send_album(user_id, message.chat.id)
-            return
-        
-        # If still only 1 after waiting, send single
-        if count == 1:
-            await send_single_silent(user_id, message.chat.id, media_groups[user_id][0])
-            await cleanup(user_id, message.chat.id)
-        elif count > 1:
-            # Multiple detected - wait a bit more then auto-send
-            await asyncio.sleep(1.0)
-            await auto_send_album(user_id, message.chat.id)
+    # Only enqueue: the window strategy waits for more media (2s, then 1s
+    # more for several items) and delivers one item at a time per user on
+    # the scheduler, as the per-user lock used to, without a dispatcher
+    # worker sleeping through it
+    batcher.submit(message.from_user.id, message.chat.id, message)
 
 # ------------------ Auto Album System ------------------ #
 
-async def auto_send_album(user_id, chat_id):
+async def auto_send_album(user_id, chat_id, medias):
     """Automatically send album without user interaction"""
-    medias = media_groups[user_id]
-    
     if not medias:
         return
     
@@ -129,7 +107,7 @@ async def auto_send_album(user_id, chat_id):
     # Send single if only 1
     if count == 1:
         await send_single_silent(user_id, chat_id, medias[0])
-        await cleanup(user_id, chat_id)
+        await cleanup(chat_id, medias)
         return
     
     # Forward to storage FIRST in parallel
@@ -151,7 +129,9 @@ async def auto_send_album(user_id, chat_id):
         await safe_send(bot.send_media_group, chat_id, media=media_list)
     
     # Cleanup
-    await cleanup(user_id, chat_id)
+    await cleanup(chat_id, medias)
+
+batcher = get_strategy("window", auto_send_album, Config.MAX_ALBUM_SIZE, scheduler, window=2.0, settle=1.0)
 
 async def send_single_silent(user_id, chat_id, media):
     """Send single media without extra messages"""
@@ -174,13 +154,13 @@ async def send_single_silent(user_id, chat_id, media):
 
 async def forward_to_storage(message):
     """Forward media to storage group silently"""
-    if not Config.STORAGE_GROUP_ID:
+    if not Config.ARCHIVE_CHAT_ID:
         return
 
     try:
         await safe_send(
             bot.forward_messages,
-            Config.STORAGE_GROUP_ID,
+            Config.ARCHIVE_CHAT_ID,
             from_chat_id=message.chat.id,
             message_ids=message.id
         )
@@ -189,21 +169,25 @@ async def forward_to_storage(message):
 
 # ------------------ Cleanup System ------------------ #
 
-async def cleanup(user_id, chat_id):
-    """Clean up user data and delete original messages"""
-    for msg_id in original_messages[user_id]:
+async def cleanup(chat_id, medias):
+    """Delete the original messages of a delivered batch"""
+    for msg_id in (m.id for m in medias):
         try:
             await bot.delete_messages(chat_id, msg_id)
             await asyncio.sleep(0.05)  # Tiny delay between deletions
         except Exception as e:
             logging.error(f"Delete failed for msg {msg_id}: {e}")
 
-    media_groups[user_id].clear()
-    original_messages[user_id].clear()
-
 # ------------------ Bot Start ------------------ #
 
-if __name__ == "__main__":
+def run():
     logging.info("Starting Anonymous Forward Bot...")
     logging.info(f"Max album size: {Config.MAX_ALBUM_SIZE}")
+    logging.info(f"Dispatcher workers: {Config.WORKERS}")
+    logging.info(f"Storage group: {Config.ARCHIVE_CHAT_ID or 'Not configured'}")
+    if len(Config.STORAGE_GROUP_IDS) > 1:
+        logging.warning(f"Storage sharding needs PIPELINE=anonbot, archiving to {Config.ARCHIVE_CHAT_ID} only")
     bot.run()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,99 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# ------------------ Fair Outbound Limiter ------------------
+#
+# The global send budget is shared between users with weighted fair queueing.
+# Each request gets a start tag and a virtual finish tag of
+#
+#     start = max(virtual_time, user's last finish tag)
+#     finish = start + cost / weight
+#
+# and requests are granted in finish tag order. A user who just sent 200
+# files has a finish tag far ahead of everyone else, so a single file from
+# another user goes first even though the heavy user queued earlier. The
+# virtual time is the largest start tag granted so far; a light request can
+# be granted after heavier ones with later start tags, so it never moves
+# back. Idle users do not bank credit because the start tag never falls
+# behind the virtual time.
+
+
+class FairLimiter:
+    """Token bucket of ``rate`` messages per second granted in fair order
+
+    ``burst`` is the bucket size, one second worth of messages by default.
+    """
+
+    def __init__(self, rate, weights=None, default_weight=1.0, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self.finish = {}
+        self.vtime = 0.0
+        self.heap = []
+        self.order = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.runner = None
+
+    def weight(self, key):
+        return self.weights.get(key, self.default_weight)
+
+    async def acquire(self, key=None, cost=1):
+        """Wait until ``key`` may send ``cost`` messages"""
+        start = max(self.vtime, self.finish.get(key, 0.0))
+        tag = start + cost / self.weight(key)
+        self.finish[key] = tag
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.heap, (tag, next(self.order), start, cost, future))
+        if self.runner is None or self.runner.done():
+            self.runner = asyncio.get_running_loop().create_task(self._run())
+        self.wakeup.set()
+        await future
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def _run(self):
+        while True:
+            # Requests whose caller gave up are skipped
+            while self.heap and self.heap[0][-1].done():
+                heapq.heappop(self.heap)
+
+            if not self.heap:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            _, _, start, cost, future = self.heap[0]
+            self._refill()
+            # A request larger than the bucket goes out once it is full
+            needed = min(cost, self.capacity)
+            if self.tokens < needed:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), (needed - self.tokens) / self.rate)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.heap)
+            self.tokens -= cost
+            self.vtime = max(self.vtime, start)
+            future.set_result(None)
+
+            if len(self.finish) > 10000:
+                self.finish = {k: tag for k, tag in self.finish.items() if tag > self.vtime}
+
+    def forget(self, key):
+        self.finish.pop(key, None)
+
+    def queued(self):
+        return sum(1 for entry in self.heap if not entry[-1].done())
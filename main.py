@@ -8,9 +8,13 @@ from pyrogram.types import (
     InputMediaPhoto,
     InputMediaVideo,
     InputMediaDocument,
+    InputMediaAudio,
 )
 
 from Config import Config
+from albums import file_id_of, holds_group, is_whole_group, media_kind, plan_albums
+from batching import get_strategy
+from tasks import TaskScheduler
 
 # ------------------ Logging ------------------ #
 
@@ -25,18 +29,20 @@ bot = Client(
     "AnonForwardBot",
     api_id=Config.API_ID,
     api_hash=Config.API_HASH,
-    bot_token=Config.BOT_TOKEN
+    bot_token=Config.BOT_TOKEN,
+    workers=Config.WORKERS
 )
 
-# Bot ID - will be set on startup
-BOT_ID = None
+INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
 
 # ------------------ State Storage ------------------ #
 
-media_groups = defaultdict(list)
-original_messages = defaultdict(list)
-user_locks = defaultdict(asyncio.Lock)
-user_send_tasks = {}
+scheduler = TaskScheduler("debounce")  # debounce timers and deliveries, off the dispatcher workers
 
 last_send_time = defaultdict(float)
 global_timestamps = []
@@ -80,13 +86,8 @@ async def safe_send(func, chat_id, **kwargs):
 
 @bot.on_message(filters.private & filters.command("start"))
 async def start(client, message):
-    global BOT_ID
-    if BOT_ID is None:
-        BOT_ID = (await client.get_me()).id
-        logging.info(f"🤖 Bot ID set to: {BOT_ID}")
-    
     user_name = message.from_user.first_name
-    bot_name = (await client.get_me()).first_name
+    bot_name = client.me.first_name
     
     await message.reply_text(
         f"Hey {user_name}. \n\n"
@@ -99,57 +100,21 @@ async def start(client, message):
 
 @bot.on_message(filters.private & (filters.photo | filters.video | filters.document | filters.audio))
 async def handle_media(client, message):
-    global BOT_ID
-    if BOT_ID is None:
-        BOT_ID = (await client.get_me()).id
-        logging.info(f"🤖 Bot ID set to: {BOT_ID}")
-    
     user_id = message.from_user.id
-    chat_id = message.chat.id
     
     # Ignore messages from the bot itself
-    if user_id == BOT_ID:
+    if user_id == client.me.id:
         logging.debug(f"🤖 Ignoring message from bot itself")
         return
     
+    # Only enqueue: the debounce strategy restarts the user's 3s timer and
+    # sends once it expires or the album is full, on the scheduler, so no
+    # dispatcher worker waits through the storage forwards, sends and deletes
     logging.info(f"📥 Received media from user {user_id}")
-    
-    media_groups[user_id].append(message)
-    original_messages[user_id].append(message.id)
-    
-    count = len(media_groups[user_id])
-    logging.info(f"📊 User {user_id} now has {count} media items queued")
-    
-    if user_id in user_send_tasks:
-        logging.info(f"⏰ Cancelling previous timer for user {user_id}")
-        user_send_tasks[user_id].cancel()
-    
-    if count >= Config.MAX_ALBUM_SIZE:
-        logging.info(f"🚀 Max size reached for user {user_id}, sending immediately")
-        await send_user_media(user_id, chat_id)
-    else:
-        logging.info(f"⏰ Scheduling send in 3 seconds for user {user_id}")
-        task = asyncio.create_task(delayed_send(user_id, chat_id, 3.0))
-        user_send_tasks[user_id] = task
+    batcher.submit(user_id, message.chat.id, message)
 
-async def delayed_send(user_id, chat_id, delay):
-    """Wait and then send media"""
-    try:
-        logging.info(f"⏳ Timer started for user {user_id} - waiting {delay}s")
-        await asyncio.sleep(delay)
-        logging.info(f"✅ Timer expired for user {user_id} - sending now")
-        await send_user_media(user_id, chat_id)
-    except asyncio.CancelledError:
-        logging.info(f"❌ Timer cancelled for user {user_id}")
-        pass
-
-async def send_user_media(user_id, chat_id):
-    """Send all queued media for a user"""
-    if user_id in user_send_tasks:
-        del user_send_tasks[user_id]
-    
-    medias = media_groups[user_id].copy()
-    
+async def send_user_media(user_id, chat_id, medias):
+    """Send a batch closed by the debounce strategy"""
     if not medias:
         logging.warning(f"⚠️ No media to send for user {user_id}")
         return
@@ -159,7 +124,7 @@ async def send_user_media(user_id, chat_id):
     
     try:
         # Forward to storage first (ONLY user messages)
-        if Config.STORAGE_GROUP_ID:
+        if Config.ARCHIVE_CHAT_ID:
             logging.info(f"💾 Forwarding {count} items to storage...")
             storage_tasks = [forward_to_storage(m) for m in medias]
             await asyncio.gather(*storage_tasks, return_exceptions=True)
@@ -174,19 +139,25 @@ async def send_user_media(user_id, chat_id):
             await send_album(chat_id, medias)
         
         # Delete originals
-        logging.info(f"🗑️ Deleting {len(original_messages[user_id])} original messages")
-        await cleanup(user_id, chat_id)
+        logging.info(f"🗑️ Deleting {count} original messages")
+        await cleanup(chat_id, medias)
         
         logging.info(f"✅ Complete! Sent {count} items to user {user_id}")
         
     except Exception as e:
         logging.error(f"❌ Error in send_user_media: {e}", exc_info=True)
-        await cleanup(user_id, chat_id)
+        await cleanup(chat_id, medias)
+
+batcher = get_strategy("debounce", send_user_media, Config.MAX_ALBUM_SIZE, scheduler, delay=3.0)
 
 # ------------------ Send Functions ------------------ #
 
 async def send_single_media(chat_id, media):
     """Send a single media item"""
+    if Config.DELIVERY_MODE == "copy":
+        if await safe_send(bot.copy_message, chat_id, from_chat_id=media.chat.id, message_id=media.id):
+            return
+        logging.warning(f"⚠️ Copying msg {media.id} failed, sending it rebuilt")
     try:
         if media.photo:
             await safe_send(bot.send_photo, chat_id, photo=media.photo.file_id)
@@ -201,43 +172,60 @@ async def send_single_media(chat_id, media):
         raise
 
 async def send_album(chat_id, medias):
-    """Send multiple media as an album"""
-    media_list = []
+    """Send multiple media as albums grouped by compatible kind"""
+    albums = plan_albums(medias, Config.MAX_ALBUM_SIZE)
     
-    for m in medias:
-        try:
-            if m.photo:
-                media_list.append(InputMediaPhoto(m.photo.file_id))
-            elif m.video:
-                media_list.append(InputMediaVideo(m.video.file_id))
-            elif m.document:
-                media_list.append(InputMediaDocument(m.document.file_id))
-            elif m.audio:
-                logging.warning(f"⚠️ Skipping audio in album")
-                continue
-        except Exception as e:
-            logging.error(f"❌ Error adding media to album: {e}")
-    
-    if not media_list:
+    if not albums:
         logging.error(f"❌ No valid media in album!")
         return
     
-    logging.info(f"📚 Sending album with {len(media_list)} items")
-    await safe_send(bot.send_media_group, chat_id, media=media_list)
+    for album in albums:
+        if len(album) == 1:
+            await send_single_media(chat_id, album[0])
+            continue
+        
+        if Config.DELIVERY_MODE == "copy" and is_whole_group(album, medias) and await whole_group_on_server(album):
+            copied = await safe_send(
+                bot.copy_media_group, chat_id, from_chat_id=album[0].chat.id, message_id=album[0].id
+            )
+            if copied:
+                logging.info(f"📚 Copied album with {len(album)} items")
+                continue
+            logging.warning(f"⚠️ Copying album failed, sending it rebuilt")
+        
+        media_list = [INPUT_MEDIA[media_kind(m)](file_id_of(m)) for m in album]
+        logging.info(f"📚 Sending album with {len(media_list)} items")
+        await safe_send(bot.send_media_group, chat_id, media=media_list)
+
+async def whole_group_on_server(album):
+    """Check the album holds every message of its group, copy_media_group copies them all"""
+    try:
+        # Rate-limited like every other call; RPC errors come back as None
+        group = await safe_send(bot.get_media_group, album[0].chat.id, message_id=album[0].id)
+    except Exception as e:
+        logging.warning(f"⚠️ Could not fetch album {album[0].media_group_id}: {e}")
+        return False
+    if not group:
+        logging.warning(f"⚠️ Could not fetch album {album[0].media_group_id}, sending it rebuilt")
+        return False
+    if not holds_group(album, group):
+        logging.info(f"📚 Album {album[0].media_group_id} was split across batches, sending it rebuilt")
+        return False
+    return True
 
 # ------------------ Storage Forwarding ------------------ #
 
 async def forward_to_storage(message):
     """Forward media to storage group - ONLY from users, not bot"""
-    if not Config.STORAGE_GROUP_ID:
+    if not Config.ARCHIVE_CHAT_ID:
         return
     
     # Only forward original user messages, not bot's re-sent messages
-    if message.from_user and message.from_user.id != BOT_ID:
+    if message.from_user and message.from_user.id != bot.me.id:
         try:
             await safe_send(
                 bot.forward_messages,
-                Config.STORAGE_GROUP_ID,
+                Config.ARCHIVE_CHAT_ID,
                 from_chat_id=message.chat.id,
                 message_ids=message.id
             )
@@ -249,28 +237,29 @@ async def forward_to_storage(message):
 
 # ------------------ Cleanup System ------------------ #
 
-async def cleanup(user_id, chat_id):
-    """Clean up user data and delete original messages"""
-    msg_ids = original_messages[user_id].copy()
-    
-    for msg_id in msg_ids:
+async def cleanup(chat_id, medias):
+    """Delete the original messages of a delivered batch"""
+    for msg_id in (m.id for m in medias):
         try:
             await bot.delete_messages(chat_id, msg_id)
             await asyncio.sleep(0.05)
         except Exception as e:
             logging.debug(f"Delete failed for msg {msg_id}: {e}")
 
-    media_groups[user_id].clear()
-    original_messages[user_id].clear()
-
 # ------------------ Bot Start ------------------ #
 
-if __name__ == "__main__":
+def run():
     logging.info("=" * 50)
     logging.info("🚀 Starting Anonymous Forward Bot")
     logging.info("=" * 50)
     logging.info(f"📊 Max album size: {Config.MAX_ALBUM_SIZE}")
-    logging.info(f"💾 Storage group: {Config.STORAGE_GROUP_ID or 'Not configured'}")
+    logging.info(f"👷 Dispatcher workers: {Config.WORKERS}")
+    logging.info(f"💾 Storage group: {Config.ARCHIVE_CHAT_ID or 'Not configured'}")
+    if len(Config.STORAGE_GROUP_IDS) > 1:
+        logging.warning(f"⚠️ Storage sharding needs PIPELINE=anonbot, archiving to {Config.ARCHIVE_CHAT_ID} only")
     logging.info(f"⚡ Rate limits: {Config.RATE_LIMIT_GLOBAL} global, {Config.RATE_LIMIT_PER_CHAT} per chat")
     logging.info("=" * 50)
     bot.run()
+
+if __name__ == "__main__":
+    run()
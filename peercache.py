@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+# ------------------ Peer Cache ------------------
+#
+# Rows have pyrogram's peer layout: (id, access_hash, type, username, phone_number).
+
+
+class PeerCache:
+    """LRU of peer rows plus the rows that still have to be written to disk
+
+    Upserts that do not change a row are not marked dirty, so a user who
+    keeps sending media costs a dict lookup instead of a database write.
+    Evicted rows stay in the dirty set until they have been flushed.
+    """
+
+    def __init__(self, max_size=50000):
+        self.max_size = max_size
+        self.rows = OrderedDict()
+        self.dirty = {}
+
+    def update(self, peers):
+        for row in peers:
+            peer_id = row[0]
+            if self.rows.get(peer_id) == row:
+                self.rows.move_to_end(peer_id)
+                continue
+            self.rows[peer_id] = row
+            self.rows.move_to_end(peer_id)
+            self.dirty[peer_id] = row
+        self._evict()
+
+    def put(self, row):
+        """Cache a row read from disk"""
+        self.rows[row[0]] = row
+        self.rows.move_to_end(row[0])
+        self._evict()
+
+    def get(self, peer_id):
+        row = self.rows.get(peer_id)
+        if row is not None:
+            self.rows.move_to_end(peer_id)
+            return row
+        return self.dirty.get(peer_id)
+
+    def take_dirty(self):
+        """Return the rows to write and start a new batch"""
+        rows = list(self.dirty.values())
+        self.dirty = {}
+        return rows
+
+    def _evict(self):
+        while len(self.rows) > self.max_size:
+            self.rows.popitem(last=False)
+
+    def __len__(self):
+        return len(self.rows)
@@ -0,0 +1,116 @@
+"""Start the bot with the pipeline selected by PIPELINE
+
+    python run.py            # start the bot
+    python run.py --check    # load the pipeline, report startup cost and exit
+
+Only the selected pipeline module is imported. Import time by top-level
+package and the resident memory after loading are logged at startup.
+"""
+import argparse
+import builtins
+import logging
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# PIPELINE value -> module with a run() function
+PIPELINES = {
+    "anonbot": "anonbot",  # batching strategies, fair limiter, storage shards, worker processes
+    "debounce": "main",  # one debounce timer per user
+    "legacy": "bot",  # the original bot
+}
+
+
+class ImportTimer:
+    """Self time of every import made while active, summed by top-level package"""
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.stack = []
+        self.total = 0.0
+        self.original = builtins.__import__
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, *exc):
+        builtins.__import__ = self.original
+        self.total += time.perf_counter() - self.started
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Relative and repeated imports count towards the importing package
+        if level or name in sys.modules:
+            return self.original(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        self.stack.append(0.0)
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.times[name.partition(".")[0]] += elapsed - self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+
+    def load(self, name):
+        with self:
+            __import__(name)
+        return sys.modules[name]
+
+    def report(self, top=8):
+        slowest = sorted(self.times.items(), key=lambda item: item[1], reverse=True)[:top]
+        return ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in slowest)
+
+
+@contextmanager
+def startup_logging():
+    """Log at INFO until the pipeline is loaded, then leave logging to its own basicConfig"""
+    root = logging.getLogger()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s - %(message)s"))
+    level = root.level
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    try:
+        yield
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+
+
+def rss_mb():
+    # Peak resident set size, in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start the bot with the pipeline selected by PIPELINE")
+    parser.add_argument("--check", action="store_true", help="load the pipeline, report startup cost and exit")
+    args = parser.parse_args()
+
+    timer = ImportTimer()
+    Config = timer.load("Config").Config
+    if Config.PIPELINE not in PIPELINES:
+        raise ValueError(f"Unknown PIPELINE {Config.PIPELINE!r}, expected one of {', '.join(PIPELINES)}")
+
+    # Every pipeline: the loop before its client is created, the crypto check before connecting
+    backends = timer.load("backends")
+    with startup_logging(), timer:  # the crypto check imports pyrogram
+        backends.install_event_loop(Config.EVENT_LOOP)
+        backends.check_crypto(Config.REQUIRE_TGCRYPTO)
+
+    pipeline = timer.load(PIPELINES[Config.PIPELINE])
+
+    logging.info(
+        f"Pipeline {Config.PIPELINE} loaded in {timer.total * 1000:.0f}ms, RSS {rss_mb():.0f} MB "
+        f"(imports: {timer.report()})"
+    )
+    if not args.check:
+        pipeline.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import sqlite3
+
+from pyrogram.storage import FileStorage
+from pyrogram.storage.sqlite_storage import get_input_peer
+
+from peercache import PeerCache
+
+# ------------------ Session Storage ------------------
+#
+# Pyrogram's FileStorage upserts the peers of every update straight into
+# SQLite on the event-loop thread. BatchedFileStorage keeps them in an LRU
+# and writes the changed rows in one transaction every few seconds.
+
+PEER_UPSERT = (
+    "REPLACE INTO peers (id, access_hash, type, username, phone_number) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+
+class BatchedFileStorage(FileStorage):
+    """Session file with in-memory peers flushed to disk in batches"""
+
+    def __init__(self, name, workdir, cache_size=50000, flush_interval=5.0):
+        super().__init__(name, workdir)
+        self.peers = PeerCache(cache_size)
+        self.flush_interval = flush_interval
+        self.flush_task = None
+
+    async def open(self):
+        # Same as FileStorage.open without the VACUUM, which rewrites the
+        # whole file on every start
+        file_exists = self.database.is_file()
+        self.conn = sqlite3.connect(str(self.database), timeout=1, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        if not file_exists:
+            self.create()
+        else:
+            self.update()
+
+        self.flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logging.error(f"Session peer flush failed: {e}")
+
+    def flush(self):
+        """Write every changed peer in one transaction"""
+        rows = self.peers.take_dirty()
+        if not rows:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany(PEER_UPSERT, rows)
+        except sqlite3.Error:
+            # Keep them for the next attempt
+            for row in rows:
+                self.peers.dirty.setdefault(row[0], row)
+            raise
+        logging.debug(f"Flushed {len(rows)} peers to the session file")
+
+    async def save(self):
+        self.flush()
+        await super().save()
+
+    async def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.flush()
+        await super().close()
+
+    async def update_peers(self, peers):
+        self.peers.update(peers)
+
+    async def get_peer_by_id(self, peer_id):
+        row = self.peers.get(peer_id)
+        if row is None:
+            row = self.conn.execute(
+                "SELECT id, access_hash, type, username, phone_number FROM peers WHERE id = ?",
+                (peer_id,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"ID not found: {peer_id}")
+            self.peers.put(row)
+        return get_input_peer(*row[:3])
+
+    async def get_peer_by_username(self, username):
+        # Rare lookups go to disk, so write pending changes first
+        self.flush()
+        return await super().get_peer_by_username(username)
+
+    async def get_peer_by_phone_number(self, phone_number):
+        self.flush()
+        return await super().get_peer_by_phone_number(phone_number)
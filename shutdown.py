@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+
+# ------------------ Graceful Drain ------------------
+#
+# On SIGTERM the pending batches are flushed as fast as the rate limiter lets
+# them through, bounded by a deadline. Batches that do not make it are written
+# to a small JSON file so the next start can pick them up again. A delivery
+# cut off half way saves only its tail: the items it had not sent yet, and the
+# originals it sent but had not deleted.
+
+ARCHIVED, SENT, DELETED = 1, 2, 3
+
+# What is left of a batch: items to send, originals to delete, items already archived
+Remainder = namedtuple("Remainder", "user_id chat_id medias deletes archived")
+
+
+class Progress:
+    """How far each message of a delivery got: ARCHIVED, SENT or DELETED"""
+
+    def __init__(self):
+        self.states = {}
+
+    def mark(self, chat_id, medias, state):
+        for m in medias:
+            key = (chat_id, m.id)
+            self.states[key] = max(self.states.get(key, 0), state)
+
+    def forget(self, chat_id, medias):
+        for m in medias:
+            self.states.pop((chat_id, m.id), None)
+
+    def remainder(self, user_id, chat_id, medias):
+        """The part of a batch that still has to be sent or deleted"""
+        states = [self.states.get((chat_id, m.id), 0) for m in medias]
+        unsent = [m for m, state in zip(medias, states) if state < SENT]
+        deletes = [m for m, state in zip(medias, states) if state == SENT]
+        archived = bool(unsent) and all(state == ARCHIVED for state in states if state < SENT)
+        return Remainder(user_id, chat_id, unsent, deletes, archived)
+
+
+async def drain(batches, deliver, inflight, deadline):
+    """Deliver ``batches`` and wait for ``inflight`` deliveries until ``deadline``
+
+    ``inflight`` maps delivery tasks created earlier, started or not, to their
+    batch; it is read once, before anything is awaited. Returns
+    ``(delivered, lost)`` as lists of ``(user_id, chat_id, medias)``.
+    """
+    tasks = dict(inflight)
+    for batch in batches:
+        tasks[asyncio.create_task(deliver(*batch))] = batch
+
+    if not tasks:
+        return [], []
+
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    delivered, lost = [], []
+    for task, batch in tasks.items():
+        if task in done and not task.cancelled() and task.exception() is None and task.result():
+            delivered.append(batch)
+        else:
+            lost.append(batch)
+    return delivered, lost
+
+
+def worker_path(path, index):
+    """Per-worker variant of a state file, traces.jsonl -> traces.w2.jsonl"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{index}{ext}"
+
+
+def persist_pending(path, remainders):
+    """Write what is left of undelivered batches as message ids so it can be replayed"""
+    entries = [
+        {
+            "user_id": r.user_id,
+            "chat_id": r.chat_id,
+            "message_ids": [m.id for m in r.medias],
+            "delete_ids": [m.id for m in r.deletes],
+            "archived": r.archived,
+        }
+        for r in remainders
+    ]
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(entries, f)
+    os.replace(tmp, path)
+
+
+def load_pending(path):
+    """Read and remove the batches persisted by the previous shutdown"""
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not read pending batches from {path}: {e}")
+        return []
+    os.remove(path)
+    return entries
+
+
+def log_drain_metrics(started, delivered, lost, path=None):
+    """Log the drain outcome; ``lost`` holds the Remainders of undelivered batches"""
+    items_delivered = sum(len(medias) for _, _, medias in delivered)
+    items_lost = sum(len(r.medias) for r in lost)
+    deletes_left = sum(len(r.deletes) for r in lost)
+    logging.info(
+        f"metric drain_seconds={time.monotonic() - started:.2f} "
+        f"batches_delivered={len(delivered)} items_delivered={items_delivered} "
+        f"batches_lost={len(lost)} items_lost={items_lost} deletes_left={deletes_left}"
+    )
+    for r in lost:
+        logging.warning(
+            f"Undelivered batch for user {r.user_id} in chat {r.chat_id}: "
+            f"message ids {[m.id for m in r.medias]}, originals to delete {[m.id for m in r.deletes]}"
+            + (f" (saved to {path})" if path else "")
+        )
@@ -0,0 +1,105 @@
+import bisect
+import hashlib
+import logging
+import time
+
+# ------------------ Sharded Storage ------------------
+#
+# Forwards are spread over several archive chats with a consistent hash ring
+# keyed by user, so one user's media stays in one chat and adding a chat only
+# moves a fraction of the users. Every chat has its own per-chat rate budget
+# in the limiter; this module only tracks which chats are healthy.
+#
+# Only a FloodWait or an error about the chat itself takes a chat out of
+# rotation. Errors about one message (deleted original, protected content)
+# fail on every chat alike and say nothing about the chat's health.
+
+RING_REPLICAS = 64
+FAILURE_BACKOFF = 60  # seconds a chat is skipped after a chat-level error
+
+# Telegram errors that mean the bot cannot post to the chat at all
+SHARD_ERRORS = frozenset({
+    "CHANNEL_INVALID",
+    "CHANNEL_PRIVATE",
+    "CHAT_ADMIN_REQUIRED",
+    "CHAT_FORBIDDEN",
+    "CHAT_ID_INVALID",
+    "CHAT_RESTRICTED",
+    "CHAT_SEND_MEDIA_FORBIDDEN",
+    "CHAT_WRITE_FORBIDDEN",
+    "PEER_ID_INVALID",
+    "USER_BANNED_IN_CHANNEL",
+})
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+
+def is_shard_error(error):
+    """True if a failed forward means the chat is unusable, not just the message"""
+    return getattr(error, "ID", None) in SHARD_ERRORS
+
+
+class StorageShards:
+    """Consistent hash ring of archive chats with per-chat health"""
+
+    def __init__(self, chat_ids, replicas=RING_REPLICAS):
+        self.chat_ids = list(dict.fromkeys(chat_ids))
+        ring = sorted(
+            (ring_hash(f"{chat_id}:{i}"), chat_id)
+            for chat_id in self.chat_ids
+            for i in range(replicas)
+        )
+        self.ring_keys = [key for key, _ in ring]
+        self.ring_chats = [chat_id for _, chat_id in ring]
+        self.blocked_until = {chat_id: 0.0 for chat_id in self.chat_ids}
+        self.failures = {chat_id: 0 for chat_id in self.chat_ids}
+        self.forwarded = {chat_id: 0 for chat_id in self.chat_ids}
+
+    def __bool__(self):
+        return bool(self.chat_ids)
+
+    def owners(self, user_id):
+        """All chats in ring order starting at the user's home shard"""
+        if not self.chat_ids:
+            return []
+        start = bisect.bisect(self.ring_keys, ring_hash(user_id)) % len(self.ring_keys)
+        seen = []
+        for i in range(len(self.ring_chats)):
+            chat_id = self.ring_chats[(start + i) % len(self.ring_chats)]
+            if chat_id not in seen:
+                seen.append(chat_id)
+                if len(seen) == len(self.chat_ids):
+                    break
+        return seen
+
+    def route(self, user_id):
+        """Healthy chats to try for the user in ring order, empty if every chat is blocked"""
+        now = time.monotonic()
+        return [c for c in self.owners(user_id) if self.blocked_until[c] <= now]
+
+    def mark_ok(self, chat_id, count=1):
+        self.failures[chat_id] = 0
+        self.forwarded[chat_id] += count
+
+    def mark_flood(self, chat_id, seconds):
+        logging.warning(f"Storage shard {chat_id} flood-limited for {seconds}s, failing over")
+        self.blocked_until[chat_id] = time.monotonic() + seconds
+
+    def mark_failed(self, chat_id):
+        self.failures[chat_id] += 1
+        backoff = FAILURE_BACKOFF * min(self.failures[chat_id], 10)
+        logging.warning(f"Storage shard {chat_id} failed {self.failures[chat_id]} times, skipping for {backoff}s")
+        self.blocked_until[chat_id] = time.monotonic() + backoff
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            chat_id: {
+                "healthy": self.blocked_until[chat_id] <= now,
+                "failures": self.failures[chat_id],
+                "forwarded": self.forwarded[chat_id],
+            }
+            for chat_id in self.chat_ids
+        }
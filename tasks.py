@@ -0,0 +1,41 @@
+import asyncio
+import logging
+
+# ------------------ Task Scheduler ------------------
+#
+# Batching timers and deliveries run as tasks owned by the bot instead of
+# inside pyrogram's handler workers, so a handler only has to enqueue.
+
+
+class TaskScheduler:
+    """Run coroutines as background tasks and keep track of them"""
+
+    def __init__(self, name="tasks"):
+        self.name = name
+        self.tasks = set()
+        self.labels = {}  # task -> label given to spawn, until the task is done
+
+    def spawn(self, coro, label=None):
+        """Run ``coro`` as a task; ``label`` is kept in ``labels`` from now until it is done"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        if label is not None:
+            self.labels[task] = label
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task):
+        self.tasks.discard(task)
+        self.labels.pop(task, None)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Background task in {self.name} failed", exc_info=task.exception())
+
+    def call_later(self, delay, coro_fn, *args):
+        """Spawn ``coro_fn(*args)`` after ``delay`` seconds, cancellable through the returned task"""
+        async def delayed():
+            await asyncio.sleep(delay)
+            await coro_fn(*args)
+        return self.spawn(delayed())
+
+    def __len__(self):
+        return len(self.tasks)
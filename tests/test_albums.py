@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+from albums import MEDIA_KINDS, holds_group, is_whole_group, media_kind, plan_albums
+
+
+def message(i, kind="photo", group=None):
+    item = SimpleNamespace(id=i, media_group_id=group, **{k: None for k in MEDIA_KINDS})
+    if kind:
+        setattr(item, kind, SimpleNamespace(file_id=f"file-{i}"))
+    return item
+
+
+def ids(albums):
+    return [[m.id for m in album] for album in albums]
+
+
+def test_media_kind():
+    assert media_kind(message(1, "audio")) == "audio"
+    assert media_kind(message(1, None)) is None
+
+
+def test_partitions_by_album_group_in_order_of_first_item():
+    kinds = ["document", "photo", "audio", "video", "document", "photo", "audio"]
+    medias = [message(i, kind) for i, kind in enumerate(kinds)]
+    # Photos and videos share an album, documents and audio get their own
+    assert ids(plan_albums(medias)) == [[0, 4], [1, 3, 5], [2, 6]]
+
+
+def test_eleven_items_split_six_and_five():
+    medias = [message(i) for i in range(11)]
+    assert ids(plan_albums(medias)) == [list(range(6)), list(range(6, 11))]
+
+
+def test_full_albums_are_not_split():
+    medias = [message(i) for i in range(20)]
+    assert [len(album) for album in plan_albums(medias)] == [10, 10]
+    assert [len(album) for album in plan_albums(medias[:7], max_size=3)] == [3, 2, 2]
+
+
+def test_lone_items_stay_single():
+    medias = [message(0, "photo"), message(1, "document"), message(2, "audio")]
+    assert ids(plan_albums(medias)) == [[0], [1], [2]]
+
+
+def test_unsupported_media_is_skipped():
+    medias = [message(0), message(1, None), message(2, "video")]
+    assert ids(plan_albums(medias)) == [[0, 2]]
+    assert plan_albums([message(0, None)]) == []
+
+
+def test_whole_group_needs_every_batch_item_of_the_album():
+    medias = [message(0, group="a"), message(1, group="a"), message(2, group="b"), message(3)]
+    assert is_whole_group(medias[:2], medias)
+    assert not is_whole_group(medias[:1], medias)
+    # Items without a media_group_id are never an original album
+    assert not is_whole_group(medias[3:], medias)
+
+
+def test_holds_group_compares_with_the_album_on_the_server():
+    album = [message(1, group="a"), message(2, group="a")]
+    assert holds_group(album, [message(2), message(1)])
+    assert not holds_group(album, [message(1), message(2), message(3)])
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# anonbot reads these at import time; nothing connects to Telegram
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ["TRACE_SAMPLE_RATE"] = "0"
+
+import anonbot  # noqa: E402
+from fairqueue import FairLimiter  # noqa: E402
+from storage import StorageShards  # noqa: E402
+
+SHARD = -1001
+
+
+class StubBot:
+    """Records when each API call was made"""
+
+    me = SimpleNamespace(id=1, first_name="test", is_bot=True)
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            self.calls.append((name, kwargs.get("chat_id"), time.monotonic()))
+            await asyncio.sleep(0.001)
+            return True
+        call.__name__ = name
+        return call
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    stub = StubBot()
+    monkeypatch.setattr(anonbot, "bot", stub)
+    monkeypatch.setattr(anonbot, "outbound", FairLimiter(1e9))
+    monkeypatch.setattr(anonbot, "storage", StorageShards([SHARD]))
+    monkeypatch.setattr(anonbot, "last_send_time", anonbot.defaultdict(float))
+    monkeypatch.setattr(anonbot.Config, "RATE_LIMIT_PER_CHAT", 0.05)
+    return stub
+
+
+def test_concurrent_forwards_to_one_shard_are_spaced(bot):
+    async def main():
+        return await asyncio.gather(
+            *(anonbot.forward_to_storage(1000 + i, 1000 + i, [i]) for i in range(6))
+        )
+
+    assert all(asyncio.run(main()))
+    times = [t for name, chat_id, t in bot.calls if chat_id == SHARD]
+    assert len(times) == 6
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) >= 0.045
+
+
+class Outbound:
+    """Records what the global budget is charged"""
+
+    def __init__(self):
+        self.charged = []
+
+    async def acquire(self, user_id, cost=1):
+        self.charged.append((user_id, cost))
+
+
+def album_of(*ids, chat_id=1000):
+    return [SimpleNamespace(id=i, media_group_id="a", chat=SimpleNamespace(id=chat_id)) for i in ids]
+
+
+def test_album_check_on_the_server_is_rate_limited(bot, monkeypatch):
+    outbound = Outbound()
+    monkeypatch.setattr(anonbot, "outbound", outbound)
+    album = album_of(1, 2)
+
+    async def get_media_group(chat_id, message_id):
+        bot.calls.append(("get_media_group", chat_id, time.monotonic()))
+        return album_of(1, 2)
+    bot.get_media_group = get_media_group
+
+    assert asyncio.run(anonbot.whole_group_on_server(album))
+    assert outbound.charged == [(1000, 1)]
+    assert anonbot.last_send_time[1000] > 0
+
+
+def test_album_check_failure_falls_back_to_rebuilt(bot):
+    async def get_media_group(chat_id, message_id):
+        raise anonbot.RPCError("MESSAGE_ID_INVALID")
+    bot.get_media_group = get_media_group
+
+    assert not asyncio.run(anonbot.whole_group_on_server(album_of(1, 2)))
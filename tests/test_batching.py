@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+from batching import get_strategy
+from tasks import TaskScheduler
+
+
+def test_strategy_uses_the_given_scheduler():
+    scheduler = TaskScheduler("delivery")
+    assert get_strategy("debounce", None, scheduler=scheduler).scheduler is scheduler
+
+
+def test_window_delivers_one_item_at_a_time_off_the_caller():
+    async def main():
+        delivered = []
+
+        async def on_flush(user_id, chat_id, medias):
+            delivered.append([m.id for m in medias])
+
+        scheduler = TaskScheduler("delivery")
+        batcher = get_strategy("window", on_flush, 10, scheduler, window=0.01, settle=0.01)
+        for i in range(3):
+            batcher.submit(7, 5, SimpleNamespace(id=i))
+        # submit only queued the items
+        assert delivered == [] and batcher.pending() == 3
+        while len(scheduler):
+            await asyncio.sleep(0.01)
+        return delivered
+
+    assert asyncio.run(main()) == [[0], [1], [2]]
+
+
+def test_window_keeps_draining_after_a_failed_delivery():
+    async def main():
+        delivered = []
+
+        async def on_flush(user_id, chat_id, medias):
+            delivered.append([m.id for m in medias])
+            if medias[0].id == 0:
+                raise OSError("network down")
+
+        scheduler = TaskScheduler("delivery")
+        batcher = get_strategy("window", on_flush, 10, scheduler, window=0.01, settle=0.01)
+        for i in range(3):
+            batcher.submit(7, 5, SimpleNamespace(id=i))
+        while len(scheduler):
+            await asyncio.sleep(0.01)
+        return delivered, batcher
+
+    delivered, batcher = asyncio.run(main())
+    assert delivered == [[0], [1], [2]]
+    assert batcher.pending() == 0 and batcher.runners == {}
@@ -0,0 +1,70 @@
+import asyncio
+
+from fairqueue import FairLimiter
+
+
+async def queue_up(limiter, requests):
+    """Queue (key, cost) requests in order, return the tasks and the grant order"""
+    granted = []
+
+    async def request(key, cost):
+        await limiter.acquire(key, cost)
+        granted.append(key)
+
+    tasks = [asyncio.create_task(request(key, cost)) for key, cost in requests]
+    # Every request is queued before the limiter grants the first one
+    await asyncio.sleep(0)
+    return tasks, granted
+
+
+async def stop(limiter, tasks):
+    for task in tasks + [limiter.runner]:
+        task.cancel()
+    await asyncio.gather(*tasks, limiter.runner, return_exceptions=True)
+
+
+def test_light_user_goes_ahead_of_a_heavy_backlog():
+    async def main():
+        limiter = FairLimiter(rate=1000)
+        tasks, granted = await queue_up(limiter, [("heavy", 1)] * 5 + [("light", 1)])
+        await asyncio.gather(*tasks)
+        return granted
+
+    assert asyncio.run(main()) == ["heavy", "light", "heavy", "heavy", "heavy", "heavy"]
+
+
+def test_weights_share_the_budget():
+    async def main():
+        limiter = FairLimiter(rate=1000, weights={"a": 2})
+        tasks, granted = await queue_up(limiter, [("a", 1)] * 4 + [("b", 1)] * 4)
+        await asyncio.gather(*tasks)
+        return granted
+
+    assert asyncio.run(main()) == ["a", "a", "b", "a", "a", "b", "b", "b"]
+
+
+def test_cancelled_requests_are_skipped_without_tokens():
+    async def main():
+        # Three tokens and no refill to speak of
+        limiter = FairLimiter(rate=0.001, burst=3)
+        tasks, granted = await queue_up(limiter, [("heavy", 1)] * 3 + [("light", 1)])
+        tasks[-1].cancel()
+        await asyncio.gather(*tasks[:3])
+        queued = limiter.queued()
+        await stop(limiter, tasks)
+        return granted, queued
+
+    assert asyncio.run(main()) == (["heavy", "heavy", "heavy"], 0)
+
+
+def test_virtual_time_never_moves_back():
+    async def main():
+        # "slow" starts at 0 but finishes late, it is granted after "fast" started at 2
+        limiter = FairLimiter(rate=0.001, burst=4, weights={"slow": 0.25})
+        tasks, granted = await queue_up(limiter, [("fast", 1), ("slow", 1)] + [("fast", 1)] * 3)
+        await asyncio.gather(*tasks[:4])
+        vtime = limiter.vtime
+        await stop(limiter, tasks)
+        return granted, vtime
+
+    assert asyncio.run(main()) == (["fast", "fast", "fast", "slow"], 2.0)
@@ -0,0 +1,157 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import shutdown
+from batching import get_strategy
+from shutdown import ARCHIVED, DELETED, SENT, Progress, drain, load_pending, persist_pending
+from tasks import TaskScheduler
+
+
+def medias(*ids):
+    return [SimpleNamespace(id=i) for i in ids]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_drain_splits_delivered_and_lost_batches():
+    ok, failed, broken = (1, 5, medias(1)), (2, 5, medias(2)), (3, 5, medias(3))
+
+    async def deliver(user_id, chat_id, items):
+        if user_id == 3:
+            raise RuntimeError("boom")
+        return user_id == 1
+
+    delivered, lost = run(drain([ok, failed, broken], deliver, {}, 1.0))
+    assert delivered == [ok]
+    assert lost == [failed, broken]
+
+
+def test_drain_cancels_deliveries_at_the_deadline():
+    cancelled = []
+
+    async def deliver(user_id, chat_id, items):
+        try:
+            await asyncio.sleep(10 if user_id == 2 else 0)
+        except asyncio.CancelledError:
+            cancelled.append(user_id)
+            raise
+        return True
+
+    fast, slow = (1, 5, medias(1)), (2, 5, medias(2))
+    delivered, lost = run(drain([fast, slow], deliver, {}, 0.05))
+    assert delivered == [fast]
+    assert lost == [slow]
+    assert cancelled == [2]
+
+
+def test_drain_without_work_returns_at_once():
+    assert run(drain([], None, {}, 10)) == ([], [])
+
+
+def test_drain_waits_for_deliveries_flushed_but_not_started():
+    async def main():
+        delivered = []
+
+        async def on_flush(user_id, chat_id, items):
+            delivered.append(user_id)
+            return True
+
+        scheduler = TaskScheduler("delivery")
+        batcher = get_strategy("debounce", on_flush, 10, scheduler)
+        batcher.submit(7, 5, SimpleNamespace(id=1))
+        batcher.flush(7, 5)
+        # Nothing awaited yet: the delivery task has not run
+        assert delivered == [] and len(scheduler.labels) == 1
+        result = await drain(batcher.collapse(), on_flush, scheduler.labels, 1.0)
+        return delivered, result
+
+    delivered, (done, lost) = run(main())
+    assert delivered == [7]
+    assert [user_id for user_id, _, _ in done] == [7]
+    assert lost == []
+
+
+def test_cut_off_delivery_keeps_only_its_tail():
+    # 12 photos sent as two albums of 6; the deadline hits during the second
+    progress = Progress()
+    batch = (7, 5, medias(*range(1, 13)))
+
+    async def deliver(user_id, chat_id, items):
+        progress.mark(chat_id, items, ARCHIVED)
+        progress.mark(chat_id, items[:6], SENT)
+        await asyncio.sleep(10)
+        return True
+
+    delivered, lost = run(drain([batch], deliver, {}, 0.05))
+    assert delivered == []
+    remainder = progress.remainder(*lost[0])
+    assert [m.id for m in remainder.medias] == list(range(7, 13))
+    assert [m.id for m in remainder.deletes] == list(range(1, 7))
+    assert remainder.archived
+
+
+def test_remainder_of_an_untouched_batch_is_the_whole_batch():
+    remainder = Progress().remainder(7, 5, medias(1, 2))
+    assert [m.id for m in remainder.medias] == [1, 2]
+    assert remainder.deletes == []
+    assert not remainder.archived
+
+
+def test_remainder_skips_deleted_originals():
+    progress = Progress()
+    items = medias(1, 2, 3)
+    progress.mark(5, items, SENT)
+    progress.mark(5, items[:2], DELETED)
+    # A later, lower state never moves a message back
+    progress.mark(5, items, ARCHIVED)
+    remainder = progress.remainder(7, 5, items)
+    assert remainder.medias == []
+    assert [m.id for m in remainder.deletes] == [3]
+
+    progress.forget(5, items)
+    assert progress.states == {}
+
+
+def test_persist_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "pending.json")
+    progress = Progress()
+    items = medias(1, 2, 3)
+    progress.mark(5, items, ARCHIVED)
+    progress.mark(5, items[:1], SENT)
+    persist_pending(path, [progress.remainder(7, 5, items)])
+
+    assert load_pending(path) == [
+        {"user_id": 7, "chat_id": 5, "message_ids": [2, 3], "delete_ids": [1], "archived": True}
+    ]
+    # Read once: the file is removed
+    assert load_pending(path) == []
+
+
+def test_persist_replaces_the_file_atomically(tmp_path, monkeypatch):
+    path = tmp_path / "pending.json"
+    path.write_text(json.dumps([{"user_id": 1}]))
+
+    def broken_dump(entries, f):
+        f.write("[{")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(shutdown.json, "dump", broken_dump)
+    with pytest.raises(OSError):
+        persist_pending(str(path), [Progress().remainder(7, 5, medias(1))])
+    # The previous file is untouched, the half-written one never replaced it
+    assert json.loads(path.read_text()) == [{"user_id": 1}]
+
+
+def test_load_missing_file(tmp_path):
+    assert load_pending(str(tmp_path / "missing.json")) == []
+
+
+def test_load_corrupt_file(tmp_path):
+    path = tmp_path / "pending.json"
+    path.write_text("[{")
+    assert load_pending(str(path)) == []
@@ -0,0 +1,95 @@
+import pytest
+
+import storage
+from storage import FAILURE_BACKOFF, StorageShards, is_shard_error
+
+CHATS = [-1001, -1002, -1003]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(storage.time, "monotonic", lambda: now[0])
+    return now
+
+
+class RPCError(Exception):
+    def __init__(self, ID):
+        self.ID = ID
+
+
+def test_route_starts_at_home_shard_and_is_stable():
+    shards = StorageShards(CHATS)
+    for user_id in range(100):
+        route = shards.route(user_id)
+        assert sorted(route) == sorted(CHATS)
+        assert route == shards.route(user_id)
+        assert route[0] == shards.owners(user_id)[0]
+
+
+def test_users_spread_over_every_shard():
+    shards = StorageShards(CHATS)
+    homes = {shards.route(user_id)[0] for user_id in range(1000)}
+    assert homes == set(CHATS)
+
+
+def test_adding_a_shard_moves_only_some_users():
+    before = StorageShards(CHATS)
+    after = StorageShards(CHATS + [-1004])
+    moved = sum(before.route(u)[0] != after.route(u)[0] for u in range(1000))
+    assert 0 < moved < 500
+
+
+def test_flooded_shard_fails_over_until_it_recovers(clock):
+    shards = StorageShards(CHATS)
+    home = shards.route(42)[0]
+    shards.mark_flood(home, 30)
+    route = shards.route(42)
+    assert home not in route
+    assert route == [c for c in shards.owners(42) if c != home]
+
+    clock[0] += 31
+    assert shards.route(42)[0] == home
+
+
+def test_failed_shard_backs_off_longer_each_time(clock):
+    shards = StorageShards(CHATS)
+    shards.mark_failed(-1001)
+    shards.mark_failed(-1001)
+    clock[0] += FAILURE_BACKOFF + 1
+    assert -1001 not in shards.route(42)
+    clock[0] += FAILURE_BACKOFF
+    assert -1001 in shards.route(42)
+
+
+def test_success_resets_failures(clock):
+    shards = StorageShards(CHATS)
+    shards.mark_failed(-1001)
+    shards.mark_ok(-1001, 3)
+    assert shards.status()[-1001]["failures"] == 0
+    assert shards.status()[-1001]["forwarded"] == 3
+
+
+def test_all_shards_blocked_gives_empty_route(clock):
+    shards = StorageShards(CHATS)
+    for chat_id in CHATS:
+        shards.mark_flood(chat_id, 10)
+    assert shards.route(42) == []
+    assert not any(s["healthy"] for s in shards.status().values())
+
+    clock[0] += 11
+    assert len(shards.route(42)) == len(CHATS)
+
+
+def test_no_shards():
+    shards = StorageShards([])
+    assert not shards
+    assert shards.route(42) == []
+
+
+def test_only_chat_level_errors_block_a_shard():
+    assert is_shard_error(RPCError("CHAT_WRITE_FORBIDDEN"))
+    assert is_shard_error(RPCError("CHANNEL_PRIVATE"))
+    assert not is_shard_error(RPCError("MESSAGE_ID_INVALID"))
+    assert not is_shard_error(RPCError("CHAT_FORWARDS_RESTRICTED"))
+    assert not is_shard_error(ValueError("no ID"))
@@ -0,0 +1,223 @@
+"""Per-item traces from receive to delete
+
+Every accepted item gets a trace id. Spans are recorded for the batching
+wait, limiter waits, each API call, retries, chunk pacing and deletion, and
+finished traces are written as OpenTelemetry-style JSON, one trace per line,
+to a rotating file through a buffer.
+
+Print the slowest traces with:
+
+    python tracing.py [-n 10] [traces.jsonl ...]
+"""
+import argparse
+import contextvars
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import random
+import time
+from contextlib import contextmanager
+
+# Traces of the batch being delivered by the current task
+current_traces = contextvars.ContextVar("current_traces", default=())
+
+
+def new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+
+class Trace:
+    """Spans of one item"""
+
+    __slots__ = ("trace_id", "span_id", "start_ns", "attributes", "spans")
+
+    def __init__(self, **attributes):
+        self.trace_id = new_id(16)
+        self.span_id = new_id(8)
+        self.start_ns = time.time_ns()
+        self.attributes = attributes
+        self.spans = []
+
+    def add_span(self, name, start_ns, end_ns, **attributes):
+        self.spans.append((name, start_ns, end_ns, attributes))
+
+    def to_otlp(self, end_ns, status):
+        root = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": "item",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": 1 if status == "ok" else 2, "message": status},
+        }
+        children = [
+            {
+                "traceId": self.trace_id,
+                "spanId": new_id(8),
+                "parentSpanId": self.span_id,
+                "name": name,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(end_ns),
+                "attributes": otlp_attributes(attributes),
+            }
+            for name, start_ns, end_ns, attributes in self.spans
+        ]
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": otlp_attributes({"service.name": "coverbot"})},
+                "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [root] + children}],
+            }]
+        }
+
+
+def otlp_attributes(attributes):
+    result = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            result.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            result.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            result.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            result.append({"key": key, "value": {"stringValue": str(value)}})
+    return result
+
+
+class Tracer:
+    """Samples items, collects their spans and exports finished traces
+
+    Lines are buffered in memory and written to a size-rotated file when the
+    buffer is full or on ``flush``.
+    """
+
+    def __init__(self, path, sample_rate=1.0, buffer_size=200, max_bytes=10_000_000, backups=3):
+        self.sample_rate = sample_rate
+        self.active = {}
+        self.exporter = None
+        if path and sample_rate > 0:
+            target = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, delay=True)
+            target.setFormatter(logging.Formatter("%(message)s"))
+            self.exporter = logging.handlers.MemoryHandler(
+                buffer_size, flushLevel=logging.CRITICAL + 1, target=target
+            )
+            self.target = target
+
+    def __bool__(self):
+        return self.exporter is not None
+
+    def start(self, key, **attributes):
+        """Start a trace for an item if it is sampled"""
+        if not self.exporter or random.random() >= self.sample_rate:
+            return None
+        trace = self.active[key] = Trace(**attributes)
+        return trace
+
+    def get(self, key):
+        return self.active.get(key)
+
+    @contextmanager
+    def span(self, name, traces=None, **attributes):
+        """Record a span on ``traces``, by default the batch of the current task"""
+        traces = current_traces.get() if traces is None else traces
+        if not traces:
+            yield
+            return
+        start = time.time_ns()
+        try:
+            yield
+        finally:
+            end = time.time_ns()
+            for trace in traces:
+                trace.add_span(name, start, end, **attributes)
+
+    @contextmanager
+    def bind(self, traces):
+        """Make ``traces`` the current task's batch for ``span`` and ``event``"""
+        token = current_traces.set(traces)
+        try:
+            yield
+        finally:
+            current_traces.reset(token)
+
+    def event(self, name, traces=None, **attributes):
+        traces = current_traces.get() if traces is None else traces
+        now = time.time_ns()
+        for trace in traces:
+            trace.add_span(name, now, now, **attributes)
+
+    def finish(self, key, status="ok"):
+        trace = self.active.pop(key, None)
+        if trace is None or self.exporter is None:
+            return
+        line = json.dumps(trace.to_otlp(time.time_ns(), status), separators=(",", ":"))
+        self.exporter.handle(logging.LogRecord("tracing", logging.INFO, __file__, 0, line, None, None))
+
+    def expire(self, max_age):
+        """Finish traces older than ``max_age`` seconds as abandoned"""
+        cutoff = time.time_ns() - int(max_age * 1e9)
+        for key in [k for k, trace in self.active.items() if trace.start_ns < cutoff]:
+            self.finish(key, "abandoned")
+
+    def flush(self):
+        if self.exporter:
+            self.exporter.flush()
+
+    def close(self):
+        if self.exporter:
+            self.exporter.close()
+            self.target.close()
+            self.exporter = None
+
+
+# ------------------ CLI ------------------
+
+def read_traces(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+
+def summarize(spans):
+    root = next(s for s in spans if s["name"] == "item")
+    start = int(root["startTimeUnixNano"])
+    duration = (int(root["endTimeUnixNano"]) - start) / 1e9
+    attributes = {a["key"]: next(iter(a["value"].values())) for a in root["attributes"]}
+    breakdown = {}
+    for s in spans:
+        if s is root:
+            continue
+        elapsed = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e9
+        breakdown[s["name"]] = breakdown.get(s["name"], 0.0) + elapsed
+    return duration, root, attributes, breakdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the slowest item traces")
+    parser.add_argument("paths", nargs="*", default=["traces.jsonl"], help="trace files, rotated backups included")
+    parser.add_argument("-n", type=int, default=10, help="number of traces to show")
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        paths += [path] + sorted(glob.glob(f"{path}.[0-9]*"))
+    paths = [p for p in paths if os.path.isfile(p)]
+    if not paths:
+        parser.error(f"no trace files found in {', '.join(args.paths)}")
+
+    traces = sorted((summarize(spans) for spans in read_traces(paths)), key=lambda t: t[0], reverse=True)
+    for duration, root, attributes, breakdown in traces[:args.n]:
+        described = " ".join(f"{k}={v}" for k, v in attributes.items())
+        print(f"{duration:8.2f}s  trace={root['traceId']}  {root['status']['message']}  {described}")
+        for name, elapsed in sorted(breakdown.items(), key=lambda item: item[1], reverse=True):
+            print(f"          {elapsed:8.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import asyncio
+import itertools
+import logging
+import signal
+import threading
+import time
+from types import SimpleNamespace
+
+from pyrogram.errors import FloodWait, RPCError
+
+from albums import MEDIA_KINDS, file_id_of, media_kind
+
+# ------------------ Sharded Worker Processes ------------------
+#
+# With WORKER_PROCESSES > 1 the bot process becomes a front: it owns the
+# pyrogram connection and the update stream, and hands every media item to
+# one of N worker processes by user_id, so a user always lands on the same
+# worker. Each worker runs the normal pipeline (batching, album planning,
+# fair limiter with 1/N of the global budget, tracing) on its own core.
+# Workers have no Telegram connection: their API calls are sent back to the
+# front, which makes them and returns the outcome.
+#
+#   front --inbox[i]--> worker i       ("media", record) / ("batch", ...) / None
+#   worker i --calls--> front          (index, call_id, method, args, kwargs)
+#   front --replies[i]--> worker i     (call_id, outcome, value)
+
+
+def shard_of(user_id, count):
+    return user_id % count
+
+
+def to_record(message):
+    """Picklable copy of the message fields the pipeline reads"""
+    kind = media_kind(message)
+    record = SimpleNamespace(
+        id=message.id,
+        media=str(message.media),
+        media_group_id=message.media_group_id,
+        chat=SimpleNamespace(id=message.chat.id),
+        from_user=SimpleNamespace(id=message.from_user.id, is_bot=message.from_user.is_bot),
+        **{k: None for k in MEDIA_KINDS},
+    )
+    if kind:
+        setattr(record, kind, SimpleNamespace(file_id=file_id_of(message)))
+    return record
+
+
+def summarize(result):
+    """Picklable stand-in for an API result: message ids of a message list, else success"""
+    if isinstance(result, list):
+        return [SimpleNamespace(id=getattr(m, "id", None)) for m in result]
+    return bool(result)
+
+
+def pump(queue, callback, loop):
+    """Hand items of a multiprocessing queue to ``callback`` on ``loop`` until None arrives"""
+    def run():
+        while True:
+            item = queue.get()
+            loop.call_soon_threadsafe(callback, item)
+            if item is None:
+                return
+    thread = threading.Thread(target=run, name="pump", daemon=True)
+    thread.start()
+    return thread
+
+
+# ------------------ Worker Side ------------------
+
+class RemoteClient:
+    """Stands in for the pyrogram client in a worker, the front makes every call"""
+
+    def __init__(self, index, calls, me):
+        self.index = index
+        self.calls = calls
+        self.me = me
+        self.pending = {}
+        self.ids = itertools.count()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            call_id = next(self.ids)
+            future = self.pending[call_id] = asyncio.get_running_loop().create_future()
+            self.calls.put((self.index, call_id, name, args, kwargs))
+            try:
+                return await future
+            finally:
+                self.pending.pop(call_id, None)
+        call.__name__ = name
+        return call
+
+    def resolve(self, reply):
+        if reply is None:
+            return
+        call_id, outcome, value = reply
+        future = self.pending.get(call_id)
+        if future is None or future.done():
+            return
+        if outcome == "ok":
+            future.set_result(value)
+        elif outcome == "flood":
+            future.set_exception(FloodWait(value=value))
+        elif outcome == "rpc":
+            error_type, error_value = value
+            future.set_exception(error_type(value=error_value))
+        else:
+            future.set_exception(RuntimeError(value))
+
+
+class WorkerLink:
+    """A worker's end of the channels to the front"""
+
+    def __init__(self, index, inbox, calls, replies, me):
+        self.index = index
+        self.inbox = inbox
+        self.replies = replies
+        self.client = RemoteClient(index, calls, me)
+
+    async def items(self):
+        """Yield items routed to this worker until the front stops it"""
+        loop = asyncio.get_running_loop()
+        received = asyncio.Queue()
+        pump(self.inbox, received.put_nowait, loop)
+        pump(self.replies, self.client.resolve, loop)
+        while True:
+            item = await received.get()
+            if item is None:
+                return
+            yield item
+
+
+def worker_process(index, count, inbox, calls, replies, me):
+    """Process entry point of worker ``index``"""
+    # Signals go to the whole process group; only the front reacts to them
+    # and stops the workers once updates are no longer coming in
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    import anonbot
+    asyncio.run(anonbot.run_worker(index, count, WorkerLink(index, inbox, calls, replies, me)))
+
+
+# ------------------ Front Side ------------------
+
+class WorkerFront:
+    """Hands items to worker processes by user_id and makes their API calls
+
+    Calls to ``shared_chats`` (the storage shards, written by every worker)
+    are spaced ``spacing`` seconds apart here, since one worker cannot see
+    the others' sends.
+    """
+
+    def __init__(self, bot, count, shared_chats=(), spacing=1.0, target=worker_process):
+        self.bot = bot
+        self.count = count
+        self.shared_chats = set(shared_chats)
+        self.spacing = spacing
+        self.target = target
+        self.next_slot = {}
+        self.processes = []
+        self.inboxes = []
+        self.replies = []
+        self.calls = None
+        self.tasks = set()
+
+    def start(self):
+        import multiprocessing  # only the front of a sharded bot needs it
+        context = multiprocessing.get_context("spawn")
+        self.calls = context.Queue()
+        me = SimpleNamespace(id=self.bot.me.id, first_name=self.bot.me.first_name, is_bot=True)
+        for index in range(self.count):
+            inbox, replies = context.Queue(), context.Queue()
+            process = context.Process(
+                target=self.target,
+                args=(index, self.count, inbox, self.calls, replies, me),
+                name=f"worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+            self.inboxes.append(inbox)
+            self.replies.append(replies)
+        pump(self.calls, self._received, asyncio.get_running_loop())
+        logging.info(f"Started {self.count} worker processes")
+
+    def submit(self, message):
+        user_id = message.from_user.id
+        self.inboxes[shard_of(user_id, self.count)].put(("media", to_record(message)))
+
+    def submit_batch(self, user_id, chat_id, messages, archived=False):
+        """Hand a whole batch (restored after a restart) to the user's worker"""
+        records = [to_record(m) for m in messages]
+        self.inboxes[shard_of(user_id, self.count)].put(("batch", user_id, chat_id, records, archived))
+
+    def _received(self, call):
+        if call is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._execute(*call))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _space(self, chat_id):
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(chat_id, 0.0))
+        self.next_slot[chat_id] = slot + self.spacing
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _execute(self, index, call_id, method, args, kwargs):
+        chat_id = kwargs.get("chat_id", args[0] if args else None)
+        try:
+            if chat_id in self.shared_chats:
+                await self._space(chat_id)
+            result = await getattr(self.bot, method)(*args, **kwargs)
+            reply = (call_id, "ok", summarize(result))
+        except FloodWait as e:
+            reply = (call_id, "flood", e.value)
+        except RPCError as e:
+            reply = (call_id, "rpc", (type(e), e.value))
+        except Exception as e:
+            logging.error(f"Worker {index} call {method} failed: {e}")
+            reply = (call_id, "error", f"{type(e).__name__}: {e}")
+        self.replies[index].put(reply)
+
+    async def stop(self, timeout):
+        """Let every worker drain and save its batches, then stop them"""
+        for inbox in self.inboxes:
+            inbox.put(None)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, p.join, timeout) for p in self.processes))
+        for process in self.processes:
+            if process.is_alive():
+                logging.error(f"{process.name} did not stop within {timeout:.0f}s, terminating it")
+                process.terminate()
+        self.calls.put(None)
+        logging.info(f"Stopped {self.count} worker processes")